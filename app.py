@@ -1,25 +1,26 @@
 import streamlit as st
-import openai
-from openai import OpenAI
 import time
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
 import random
-import json
-from datetime import datetime
-import os
-import base64
-import plotly.graph_objects as go
-import re
-from collections import Counter
+import uuid
+from concurrent.futures import Future
+
+from assistant_stream import stream_assistant
+from chat_export import EXPORT_FORMATS, export_chat, export_filename, transcript_digest
+from chat_history import SESSION_MEMORY_LIMIT, ChatHistory, session_memory
+from chat_render import ChatRenderer, assistant_bubble
+import rate_limits
+import resources
+import run_waiter
+from metrics import SpanRecorder, TokenUsage, recording, span
+from rolling_summary import RollingSummary
+from run_waiter import RunWaiter
+from sentiment import OVERALL_NOTE, SentimentStore
 
 
 # Initialize logging
 import logging
-logging.basicConfig(level=logging.DEBUG)
-
-# Initialize NLTK
-nltk.download('vader_lexicon', quiet=True)
+resources.configure_logging()
+resources.metrics_server.get()
 
 # Streamlit configuration
 st.set_page_config(page_title="✨ VHL Change Coachbot", layout="wide")
@@ -59,215 +60,310 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Load the change talk data
-with open('change_talk.json', 'r') as f:
-    change_talk_data = [json.loads(line) for line in f]
+def classify_change_talk(text):
+    # Nearest-statement scoring, so paraphrased change talk counts too
+    return resources.change_talk_classifier.get().analyze(text)
 
-# Create a dictionary mapping statements to stages
-change_talk_dict = {item['statement'].lower(): item['stage'] for item in change_talk_data if item['statement']}
+READINESS_ASSISTANT_ID = "asst_u4tbCd0KubyMYfKeD59bBxjM"
 
-def analyze_change_talk(text):
-    sentences = re.split(r'[.!?]+', text.lower())
-    stage_counts = Counter()
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if sentence in change_talk_dict:
-            stage = change_talk_dict[sentence]
-            stage_counts[stage] += 1
-        else:
-            for statement, stage in change_talk_dict.items():
-                if statement in sentence:
-                    stage_counts[stage] += 1
-                    break
-    
-    total_statements = sum(stage_counts.values())
-    if total_statements == 0:
-        return 0, {}
-    
-    stage_weights = {
-        'pre': 0,
-        'contemplation': 1,
-        'planning': 2,
-        'action': 3,
-        'maintenance': 4
-    }
-    
-    weighted_sum = sum(stage_weights[stage] * count for stage, count in stage_counts.items())
-    change_talk_score = weighted_sum / total_statements
-    normalized_score = change_talk_score / max(stage_weights.values())
-    stage_percentages = {stage: (count / total_statements) * 100 for stage, count in stage_counts.items()}
-    
-    return normalized_score, stage_percentages
+SUMMARY_ASSISTANT_ID = "asst_2IN1dkowoziRpYyzSdgJbPZY"
+
+# Review Readiness runs on the conversation's own thread, which already holds
+# every message, so only these instructions are sent
+READINESS_INSTRUCTIONS = "Review the conversation so far for change talk and provide a summary of the user's readiness to change."
+
+# Refresh the rolling summary in the background every this many turns so
+# Summarize has little left to do; None refreshes only on Summarize
+SUMMARY_REFRESH_TURNS = 6
 
 # Initialize session state
 def initialize_session_state():
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+        st.session_state.chat_history = ChatHistory()
+    if "sentiment_store" not in st.session_state:
+        st.session_state.sentiment_store = SentimentStore()
+    if "chat_renderer" not in st.session_state:
+        st.session_state.chat_renderer = ChatRenderer()
     if "thread_id" not in st.session_state:
         st.session_state.thread_id = None
+    if "thread_synced" not in st.session_state:
+        st.session_state.thread_synced = 0  # chat_history messages already on the thread
+    if "token_usage" not in st.session_state:
+        st.session_state.token_usage = TokenUsage()
+    if "span_recorder" not in st.session_state:
+        st.session_state.span_recorder = SpanRecorder()
     if "current_assistant_id" not in st.session_state:
         st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"
     if "welcome_message_displayed" not in st.session_state:
         st.session_state.welcome_message_displayed = True
-    if "saved_chats" not in st.session_state:
-        st.session_state.saved_chats = []
+    if "conversation_id" not in st.session_state:
+        st.session_state.conversation_id = None
+    if "owner_id" not in st.session_state:
+        st.session_state.owner_id = uuid.uuid4().hex  # saves are listed and loaded by this session only
 
 initialize_session_state()
 
 # Initialize OpenAI client
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+client = resources.openai_client.lazy()
+waiter = RunWaiter(client)
+
+if "rolling_summary" not in st.session_state:
+    st.session_state.rolling_summary = RollingSummary(
+        client,
+        SUMMARY_ASSISTANT_ID,
+        waiter=waiter,
+        refresh_every=SUMMARY_REFRESH_TURNS,
+        usage=st.session_state.token_usage
+    )
 
 def create_thread_if_not_exists():
     if not st.session_state.thread_id:
-        thread = client.beta.threads.create()
+        with span("thread_create"):
+            thread = client.beta.threads.create()
         st.session_state.thread_id = thread.id
 
-def add_message_to_thread(content):
+def start_new_thread():
+    st.session_state.thread_id = None
+    st.session_state.thread_synced = 0
+
+def sync_thread():
+    # Post the chat history the thread hasn't seen yet: normally just the
+    # latest user message, or the whole history once after loading a chat
     create_thread_if_not_exists()
-    client.beta.threads.messages.create(
-        thread_id=st.session_state.thread_id,
-        role="user",
-        content=content
-    )
+    for msg in st.session_state.chat_history[st.session_state.thread_synced:]:
+        with span("message_add"):
+            client.beta.threads.messages.create(
+                thread_id=st.session_state.thread_id,
+                role=msg['role'],
+                content=msg['content']
+            )
+    st.session_state.thread_synced = len(st.session_state.chat_history)
 
-def run_assistant():
+def add_assistant_response(response):
+    # The run already put the response on the thread
+    st.session_state.chat_history.append({"role": "assistant", "content": response})
+    st.session_state.thread_synced = len(st.session_state.chat_history)
+
+def stream_assistant_response(message_placeholder):
     create_thread_if_not_exists()
-    run = client.beta.threads.runs.create(
-        thread_id=st.session_state.thread_id,
-        assistant_id=st.session_state.current_assistant_id
-    )
-    
-    while True:
-        run_status = client.beta.threads.runs.retrieve(
-            thread_id=st.session_state.thread_id,
-            run_id=run.id
-        )
-        if run_status.status == 'completed':
-            break
-        elif run_status.status == 'failed':
-            st.error(f"Run failed: {run_status.last_error}")
-            return None
-        time.sleep(1)
-    
-    messages = client.beta.threads.messages.list(
-        thread_id=st.session_state.thread_id
-    )
-    
-    return messages.data[0].content[0].text.value
-
-def stream_response(response):
-    full_response = ""
-    for chunk in response.split():
-        full_response += chunk + " "
-        yield full_response
-
-def analyze_sentiment(text):
-    sia = SentimentIntensityAnalyzer()
-    return sia.polarity_scores(text)['compound']
-
-def analyze_change_talk(text):
-    # Simplified keywords for each stage
-    stages = {
-        'pre': ['don\'t', 'won\'t', 'can\'t', 'not', 'never', 'no'],
-        'contemplation': ['might', 'maybe', 'consider', 'possibly'],
-        'planning': ['plan', 'intend', 'will', 'going to'],
-        'action': ['doing', 'started', 'began', 'implemented'],
-        'maintenance': ['continuing', 'maintaining', 'kept', 'sustained']
-    }
-    
-    words = re.findall(r'\w+', text.lower())
-    stage_counts = Counter()
 
-    for word in words:
-        for stage, keywords in stages.items():
-            if word in keywords:
-                stage_counts[stage] += 1
-    
-    total = sum(stage_counts.values())
-    if total == 0:
-        return {stage: 0 for stage in stages}, 0
+    def render(text):
+        message_placeholder.markdown(assistant_bubble(text), unsafe_allow_html=True)
 
-    percentages = {stage: (count / total) * 100 for stage, count in stage_counts.items()}
-    
-    # Calculate a simple score (higher stages have more weight)
-    score = sum(i * count for i, (stage, count) in enumerate(stage_counts.items())) / total
-    normalized_score = score / (len(stages) - 1)  # Normalize to 0-1 range
+    response, stats = stream_assistant(
+        client,
+        st.session_state.thread_id,
+        st.session_state.current_assistant_id,
+        on_text=render,
+        waiter=waiter
+    )
+    logging.debug(f"Streamed run {stats['run_id']}: first token {stats['time_to_first_token']}s, total {stats['total']:.2f}s")
+    st.session_state.token_usage.add("chat", stats['usage'])
+    if response is None:
+        st.error(f"Run {stats['status']}: {stats['last_error']}")
+    return response
+
+def request_readiness_review(thread_id):
+    # Runs on a worker thread with no script run context, so it must only
+    # use the client and never touch st.* or st.session_state
+    with rate_limits.priority(rate_limits.ANALYSIS):
+        return run_waiter.run_assistant(
+            client,
+            thread_id,
+            READINESS_ASSISTANT_ID,
+            waiter=waiter,
+            additional_instructions=READINESS_INSTRUCTIONS
+        )
 
-    return percentages, normalized_score
+def collect_readiness_review():
+    # Wait for a pending readiness review and add its analysis to the chat.
+    # Touching the placeholder between short waits lets a rerun interrupt
+    # the wait; the review keeps running and is picked up on the next run.
+    future = st.session_state.get("readiness_future")
+    if future is None:
+        return
+    placeholder = st.empty()
+    started = time.perf_counter()
+    while not future.done():
+        placeholder.caption(f"Waiting for the assistant's analysis... {time.perf_counter() - started:.0f}s")
+        time.sleep(0.25)
+    placeholder.empty()
+    st.session_state.readiness_future = None
+    cache_key = st.session_state.pop("readiness_cache_key", None)
+
+    try:
+        assistant_response, stats = future.result()
+    except Exception as e:
+        st.error(f"Readiness review failed: {e}")
+        return
+    st.session_state.token_usage.add("readiness", stats['usage'])
+    if assistant_response is None:
+        st.error(f"Run {stats['status']}: {stats['last_error']}")
+        return
+    st.subheader("AI Assistant's Analysis")
+    st.write(assistant_response)
+    if stats.get("cached"):
+        # Not on the thread yet; sync_thread() posts it with the next run
+        st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
+    else:
+        resources.response_cache.get().put(cache_key, assistant_response)
+        add_assistant_response(assistant_response)
 
 def rate_readiness():
-    st.session_state.current_assistant_id = "asst_u4tbCd0KubyMYfKeD59bBxjM"
     save_chat()  # Save chat to create the log file
     chat_log = " ".join([msg['content'] for msg in st.session_state.chat_history if msg['role'] == 'user'])
-    
+
+    # Start the assistant's review first so it runs while we analyse locally.
+    # A review that's still pending from an earlier click is reused, and one
+    # of the same transcript is answered from the cache.
+    if st.session_state.get("readiness_future") is None:
+        cache = resources.response_cache.get()
+        cache_key = cache.key(READINESS_ASSISTANT_ID, st.session_state.chat_history, READINESS_INSTRUCTIONS)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            future = Future()
+            future.set_result((cached, {"status": "completed", "last_error": None, "usage": None, "cached": True}))
+        else:
+            sync_thread()
+            future = resources.executor.get().submit(request_readiness_review, st.session_state.thread_id)
+        st.session_state.readiness_future = future
+        st.session_state.readiness_cache_key = cache_key
+
     # Analyze change talk locally
-    stage_percentages, change_talk_score = analyze_change_talk(chat_log)
+    with span("change_talk"):
+        change_talk_score, stage_percentages = classify_change_talk(chat_log)
     
     # Visualize change talk score and stage percentages
     st.subheader("Change Talk Analysis")
     st.write(f"Overall Change Talk Score: {change_talk_score:.2f}")
     
     # Create a bar chart for stage percentages
-    fig = go.Figure(data=[go.Bar(x=list(stage_percentages.keys()), y=list(stage_percentages.values()))])
-    fig.update_layout(title='Stages of Change Distribution',
-                      xaxis_title='Stage',
-                      yaxis_title='Percentage')
-    st.plotly_chart(fig)
-    
-    # Get AI assistant's analysis
-    add_message_to_thread(f"Review the following chat log for change talk and provide a summary of the user's readiness to change:\n{chat_log}")
-    assistant_response = run_assistant()
-    
-    if assistant_response:
-        st.subheader("AI Assistant's Analysis")
-        st.write(assistant_response)
-        st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
-    
-    st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"  # Reset to main assistant
+    with span("chart"):
+        import plotly.graph_objects as go
+        fig = go.Figure(data=[go.Bar(x=list(stage_percentages.keys()), y=list(stage_percentages.values()))])
+        fig.update_layout(title='Stages of Change Distribution',
+                          xaxis_title='Stage',
+                          yaxis_title='Percentage')
+        st.plotly_chart(fig)
+
+    # The analysis fills in below the chart when the review finishes
+    collect_readiness_review()
     
 def summarize_conversation():
-    st.session_state.current_assistant_id = "asst_2IN1dkowoziRpYyzSdgJbPZY"
+    collect_readiness_review()
     save_chat()  # Save chat to create the log file
-    chat_log = " ".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.chat_history])
-    add_message_to_thread(f"Please summarize the following chat log:\n{chat_log}")
-    assistant_response = run_assistant()
-    if assistant_response:
-        st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
-    st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"  # Reset to main assistant
-    st.experimental_rerun()
-
-def continue_conversation():
-    st.experimental_rerun()
+    rolling_summary = st.session_state.rolling_summary
+    cache = resources.response_cache.get()
+    cache_key = cache.key(SUMMARY_ASSISTANT_ID, st.session_state.chat_history, "summary")
+    summary = cache.get(cache_key)
+    if summary is not None:
+        rolling_summary.restore(summary, st.session_state.chat_history)
+    else:
+        with st.spinner("Summarizing..."):
+            summary, stats = rolling_summary.update(st.session_state.chat_history)
+        if summary is None:
+            st.error(f"Run {stats['status']}: {stats['last_error']}")
+            return
+        cache.put(cache_key, summary)
+    # The summary is produced off the conversation's thread, so sync_thread()
+    # posts it there with the next run; it needn't be summarised again
+    st.session_state.chat_history.append({"role": "assistant", "content": summary})
+    rolling_summary.mark_covered(st.session_state.chat_history)
+    st.rerun()
 
 def reset_chat():
-    st.session_state.chat_history = []
+    collect_readiness_review()
+    st.session_state.chat_history = ChatHistory()
+    st.session_state.conversation_id = None
+    st.session_state.chat_export = None
+    start_new_thread()
+    st.session_state.rolling_summary.reset()
     st.session_state.welcome_message_displayed = False
-    st.experimental_rerun()
+    st.rerun()
 
 def save_chat():
-    chat_data = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
-        "chat_history": st.session_state.chat_history
-    }
-    st.session_state.saved_chats.append(chat_data)
+    store = resources.chat_store.get()
+    if not st.session_state.conversation_id:
+        st.session_state.conversation_id = store.new_conversation()
+    store.save(st.session_state.conversation_id, st.session_state.chat_history, owner_id=st.session_state.owner_id)
     st.success(f"Chat history saved")
 
 def get_saved_chats():
-    return st.session_state.saved_chats
+    return resources.chat_store.get().list_saves(owner_id=st.session_state.owner_id)
 
 def load_chat(chat_data):
-    st.session_state.chat_history = chat_data['chat_history']
+    messages, conversation_id = resources.chat_store.get().load_save(chat_data['save_id'], owner_id=st.session_state.owner_id)
+    if messages is None:
+        st.error("That saved chat isn't available.")
+        return
+    st.session_state.chat_history = ChatHistory(messages)
+    st.session_state.conversation_id = conversation_id
+    st.session_state.chat_export = None
+    start_new_thread()  # the loaded history is posted to it before the next run
+    st.session_state.rolling_summary.reset()
     st.session_state.welcome_message_displayed = True
-    st.experimental_rerun()
+    st.rerun()
+
+def request_export(fmt):
+    # Produced only when asked for; PDFs are built in the background
+    history = st.session_state.chat_history
+    st.session_state.chat_export = (fmt, transcript_digest(history), export_chat(fmt, history, resources.pdf_export.get()))
+
+@st.experimental_fragment(run_every=1)
+def wait_for_export():
+    # Only this fragment reruns while the export is built, so the chat stays usable
+    export = st.session_state.get("chat_export")
+    if export is None or export[2].done():
+        st.rerun()
+    st.caption("Preparing export...")
+
+def show_export():
+    fmt = st.selectbox("Export format", list(EXPORT_FORMATS), label_visibility="collapsed")
+    if st.button("Export"):
+        request_export(fmt)
+    if st.session_state.get("chat_export") is None:
+        return
+    fmt, key, future = st.session_state.chat_export
+    if key != transcript_digest(st.session_state.chat_history):
+        # Out of date; dropped so it isn't resent with every rerun
+        st.session_state.chat_export = None
+        return
+    if not future.done():
+        wait_for_export()
+        return
+    try:
+        document = future.result()
+    except Exception as e:
+        st.session_state.chat_export = None
+        st.error(f"Export failed: {e}")
+        return
+    st.download_button(
+        label=f"Download {fmt}",
+        data=document.read(),
+        file_name=export_filename(fmt),
+        mime=EXPORT_FORMATS[fmt].mime
+    )
 
-def export_chat():
-    chat_text = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in st.session_state.chat_history])
-    b64 = base64.b64encode(chat_text.encode()).decode()
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"chat_export_{timestamp}.txt"
-    href = f'<a href="data:file/txt;base64,{b64}" download="{filename}">Download Chat History</a>'
-    return href
+def show_debug_panel():
+    # Shown with ?debug=1: where this session's reruns spend their time, and
+    # the state of the resources every session shares
+    from http_pool import pool_stats
+    spans = st.session_state.span_recorder
+    with st.expander("Debug"):
+        st.caption(f"Previous rerun (of {spans.runs} this session)")
+        st.table([{"span": name, "ms": round(seconds * 1000, 1)} for name, seconds in spans.previous_run])
+        st.caption("Session totals")
+        st.table(spans.report())
+        memory = session_memory(st.session_state)
+        st.caption(f"Session memory: {sum(memory.values()) / 2 ** 20:.2f} of {SESSION_MEMORY_LIMIT / 2 ** 20:.0f} MiB")
+        st.table({key: {"KiB": round(size / 1024, 1)} for key, size in sorted(memory.items(), key=lambda item: -item[1])})
+        st.json({
+            "http_pool": pool_stats(),
+            "scheduler": resources.scheduler.get().stats(),
+            "response_cache": resources.response_cache.get().stats(),
+            "chat_snapshots": resources.chat_store.get().snapshot_stats(),
+            "resources": resources.load_report(),
+        }, expanded=False)
 
 def show_info():
     st.markdown("""
@@ -311,40 +407,53 @@ def main():
     with chat_container:
         st.subheader(st.session_state.welcome_subheader)
         
-        st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-        for message in st.session_state.chat_history:
-            if message['role'] == 'assistant':
-                st.markdown(f'<div class="message-container" style="display: flex; justify-content: flex-end;"><div class="assistant-message">{message["content"]}</div></div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<div class="message-container" style="display: flex; justify-content: flex-start;"><div class="user-message">{message["content"]}</div></div>', unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        with span("render_history"):
+            renderer = st.session_state.chat_renderer.sync(st.session_state.chat_history)
+            if renderer.hidden_count():
+                if st.button(f"Show earlier messages ({renderer.hidden_count()} hidden)"):
+                    renderer.show_more()
+            st.markdown(f'<div class="chat-container">{renderer.window_html()}</div>', unsafe_allow_html=True)
 
     with input_container:
-        user_input = st.chat_input("Type your message...", key="user_input")
+        # A session past its memory ceiling can still be saved, summarized
+        # and reviewed, but takes no new messages
+        at_limit = sum(session_memory(st.session_state).values()) >= SESSION_MEMORY_LIMIT
+        if at_limit:
+            st.warning("This conversation has reached its size limit. Save it and start over to continue.")
+        user_input = st.chat_input("Type your message...", key="user_input", disabled=at_limit)
 
         if user_input:
+            collect_readiness_review()  # a thread can only have one active run
             st.session_state.chat_history.append({"role": "user", "content": user_input})
-            add_message_to_thread(user_input)
+            sync_thread()
 
-            with st.spinner("Thinking..."):
-                assistant_response = run_assistant()
+            with streaming_container:
+                message_placeholder = st.empty()
+                with st.spinner("Thinking..."):
+                    assistant_response = stream_assistant_response(message_placeholder)
 
             if assistant_response:
-                with streaming_container:
-                    message_placeholder = st.empty()
-                    full_response = ""
-                    for chunk in stream_response(assistant_response):
-                        message_placeholder.markdown(f'<div class="message-container" style="display: flex; justify-content: flex-end;"><div class="assistant-message">{chunk}</div></div>', unsafe_allow_html=True)
-                        time.sleep(0.05)
-                    full_response = chunk
-                st.session_state.chat_history.append({"role": "assistant", "content": full_response})
+                add_assistant_response(assistant_response)
+                st.session_state.rolling_summary.maybe_refresh(st.session_state.chat_history, resources.executor.get())
 
-            st.experimental_rerun()
+            st.rerun()
 
     with controls_container:
+        # A readiness review interrupted by a rerun fills in here
+        collect_readiness_review()
+
         if st.session_state.get("chat_history"):
-            sentiment = analyze_sentiment(" ".join(msg["content"] for msg in st.session_state["chat_history"]))
-            st.write(f'Sentiment: {sentiment:.2f}')
+            with span("sentiment"):
+                sentiment_store = st.session_state.sentiment_store.sync(st.session_state["chat_history"])
+            st.write(f'Sentiment: {sentiment_store.overall():.2f}')
+            st.caption(OVERALL_NOTE)
+            by_role = sentiment_store.by_role()
+            st.caption(" | ".join(f"{role.capitalize()}: {score:.2f}" for role, score in by_role.items()))
+
+        token_usage = st.session_state.token_usage
+        if token_usage.totals:
+            with st.expander(f"Token usage: {token_usage.total():,} tokens"):
+                st.table(token_usage.report())
 
         # Buttons for functionality in a row
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -361,7 +470,7 @@ def main():
             if st.button("Review Readiness"):
                 rate_readiness()
         with col5:
-            st.markdown(export_chat(), unsafe_allow_html=True)
+            show_export()
 
         # Saved chats dropdown
         saved_chats = get_saved_chats()
@@ -374,5 +483,10 @@ def main():
             if st.button("Load Selected Chat"):
                 load_chat(selected_chat)
 
+        if st.query_params.get("debug") == "1":
+            show_debug_panel()
+
 if __name__ == "__main__":
-    main()
+    with recording(st.session_state.span_recorder), span("rerun"):
+        main()
+    resources.preload(resources.openai_client, resources.sentiment_analyzer)
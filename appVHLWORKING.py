@@ -1,21 +1,21 @@
 import streamlit as st
-import openai
-from openai import OpenAI
-import time
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
 import random
-import json
-from datetime import datetime
-import os
-import base64
+import uuid
+
+from assistant_stream import stream_assistant
+from chat_export import EXPORT_FORMATS, export_chat, export_filename, transcript_digest
+from chat_history import SESSION_MEMORY_LIMIT, ChatHistory, session_memory
+from chat_render import ChatRenderer, assistant_bubble
+import rate_limits
+import resources
+import run_waiter
+from metrics import TokenUsage
+from run_waiter import RunWaiter
+from sentiment import OVERALL_NOTE, SentimentStore
 
 # Initialize logging
 import logging
-logging.basicConfig(level=logging.DEBUG)
-
-# Initialize NLTK
-nltk.download('vader_lexicon', quiet=True)
+resources.configure_logging()
 
 # Streamlit configuration
 st.set_page_config(page_title="✨ VHL Change Coachbot", layout="wide")
@@ -55,125 +55,199 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Summarize and Review Readiness run on the conversation's own thread, which
+# already holds every message, so only these instructions are sent
+READINESS_INSTRUCTIONS = "Review the conversation so far for change talk."
+SUMMARY_INSTRUCTIONS = "Please summarize the conversation so far."
+
 # Initialize session state
 def initialize_session_state():
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+        st.session_state.chat_history = ChatHistory()
+    if "sentiment_store" not in st.session_state:
+        st.session_state.sentiment_store = SentimentStore()
+    if "chat_renderer" not in st.session_state:
+        st.session_state.chat_renderer = ChatRenderer()
     if "thread_id" not in st.session_state:
         st.session_state.thread_id = None
+    if "thread_synced" not in st.session_state:
+        st.session_state.thread_synced = 0  # chat_history messages already on the thread
+    if "token_usage" not in st.session_state:
+        st.session_state.token_usage = TokenUsage()
     if "current_assistant_id" not in st.session_state:
         st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"
     if "welcome_message_displayed" not in st.session_state:
         st.session_state.welcome_message_displayed = True
-    if "saved_chats" not in st.session_state:
-        st.session_state.saved_chats = []
+    if "conversation_id" not in st.session_state:
+        st.session_state.conversation_id = None
+    if "owner_id" not in st.session_state:
+        st.session_state.owner_id = uuid.uuid4().hex  # saves are listed and loaded by this session only
 
 initialize_session_state()
 
 # Initialize OpenAI client
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+client = resources.openai_client.lazy()
+waiter = RunWaiter(client)
 
 def create_thread_if_not_exists():
     if not st.session_state.thread_id:
         thread = client.beta.threads.create()
         st.session_state.thread_id = thread.id
 
-def add_message_to_thread(content):
-    create_thread_if_not_exists()
-    client.beta.threads.messages.create(
-        thread_id=st.session_state.thread_id,
-        role="user",
-        content=content
-    )
+def start_new_thread():
+    st.session_state.thread_id = None
+    st.session_state.thread_synced = 0
 
-def run_assistant():
+def sync_thread():
+    # Post the chat history the thread hasn't seen yet: normally just the
+    # latest user message, or the whole history once after loading a chat
     create_thread_if_not_exists()
-    run = client.beta.threads.runs.create(
-        thread_id=st.session_state.thread_id,
-        assistant_id=st.session_state.current_assistant_id
-    )
-    
-    while True:
-        run_status = client.beta.threads.runs.retrieve(
+    for msg in st.session_state.chat_history[st.session_state.thread_synced:]:
+        client.beta.threads.messages.create(
             thread_id=st.session_state.thread_id,
-            run_id=run.id
+            role=msg['role'],
+            content=msg['content']
         )
-        if run_status.status == 'completed':
-            break
-        elif run_status.status == 'failed':
-            st.error(f"Run failed: {run_status.last_error}")
-            return None
-        time.sleep(1)
-    
-    messages = client.beta.threads.messages.list(
-        thread_id=st.session_state.thread_id
+    st.session_state.thread_synced = len(st.session_state.chat_history)
+
+def add_assistant_response(response):
+    # The run already put the response on the thread
+    st.session_state.chat_history.append({"role": "assistant", "content": response})
+    st.session_state.thread_synced = len(st.session_state.chat_history)
+
+def run_assistant(action, **run_params):
+    sync_thread()
+    response, stats = run_waiter.run_assistant(
+        client,
+        st.session_state.thread_id,
+        st.session_state.current_assistant_id,
+        waiter=waiter,
+        **run_params
     )
-    
-    return messages.data[0].content[0].text.value
+    st.session_state.token_usage.add(action, stats['usage'])
+    if response is None:
+        st.error(f"Run {stats['status']}: {stats['last_error']}")
+    return response
+
+def run_analysis(action, instructions):
+    # Summarize and Review Readiness. An analysis of the same transcript is
+    # answered from the process-wide cache without a run.
+    cache = resources.response_cache.get()
+    cache_key = cache.key(st.session_state.current_assistant_id, st.session_state.chat_history, instructions)
+    response = cache.get(cache_key)
+    if response is not None:
+        # Not on the thread yet; sync_thread() posts it with the next run
+        st.session_state.chat_history.append({"role": "assistant", "content": response})
+        return response
+    with rate_limits.priority(rate_limits.ANALYSIS):
+        response = run_assistant(action, additional_instructions=instructions)
+    if response:
+        cache.put(cache_key, response)
+        add_assistant_response(response)
+    return response
+
+def stream_assistant_response(message_placeholder):
+    create_thread_if_not_exists()
 
-def stream_response(response):
-    full_response = ""
-    for chunk in response.split():
-        full_response += chunk + " "
-        yield full_response
+    def render(text):
+        message_placeholder.markdown(assistant_bubble(text), unsafe_allow_html=True)
 
-def analyze_sentiment(text):
-    sia = SentimentIntensityAnalyzer()
-    return sia.polarity_scores(text)['compound']
+    response, stats = stream_assistant(
+        client,
+        st.session_state.thread_id,
+        st.session_state.current_assistant_id,
+        on_text=render,
+        waiter=waiter
+    )
+    logging.debug(f"Streamed run {stats['run_id']}: first token {stats['time_to_first_token']}s, total {stats['total']:.2f}s")
+    st.session_state.token_usage.add("chat", stats['usage'])
+    if response is None:
+        st.error(f"Run {stats['status']}: {stats['last_error']}")
+    return response
 
 def rate_readiness():
     st.session_state.current_assistant_id = "asst_u4tbCd0KubyMYfKeD59bBxjM"
     save_chat()  # Save chat to create the log file
-    chat_log = " ".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.chat_history])
-    add_message_to_thread(f"Review the following chat log for change talk:\n{chat_log}")
-    assistant_response = run_assistant()
-    if assistant_response:
-        st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
+    run_analysis("readiness", READINESS_INSTRUCTIONS)
     st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"  # Reset to main assistant
-    st.experimental_rerun()
+    st.rerun()
 
 def summarize_conversation():
     st.session_state.current_assistant_id = "asst_2IN1dkowoziRpYyzSdgJbPZY"
     save_chat()  # Save chat to create the log file
-    chat_log = " ".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.chat_history])
-    add_message_to_thread(f"Please summarize the following chat log:\n{chat_log}")
-    assistant_response = run_assistant()
-    if assistant_response:
-        st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
+    run_analysis("summarize", SUMMARY_INSTRUCTIONS)
     st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"  # Reset to main assistant
-    st.experimental_rerun()
-
-def continue_conversation():
-    st.experimental_rerun()
+    st.rerun()
 
 def reset_chat():
-    st.session_state.chat_history = []
+    st.session_state.chat_history = ChatHistory()
+    st.session_state.conversation_id = None
+    st.session_state.chat_export = None
+    start_new_thread()
     st.session_state.welcome_message_displayed = False
-    st.experimental_rerun()
+    st.rerun()
 
 def save_chat():
-    chat_data = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
-        "chat_history": st.session_state.chat_history
-    }
-    st.session_state.saved_chats.append(chat_data)
+    store = resources.chat_store.get()
+    if not st.session_state.conversation_id:
+        st.session_state.conversation_id = store.new_conversation()
+    store.save(st.session_state.conversation_id, st.session_state.chat_history, owner_id=st.session_state.owner_id)
     st.success(f"Chat history saved")
 
 def get_saved_chats():
-    return st.session_state.saved_chats
+    return resources.chat_store.get().list_saves(owner_id=st.session_state.owner_id)
 
 def load_chat(chat_data):
-    st.session_state.chat_history = chat_data['chat_history']
+    messages, conversation_id = resources.chat_store.get().load_save(chat_data['save_id'], owner_id=st.session_state.owner_id)
+    if messages is None:
+        st.error("That saved chat isn't available.")
+        return
+    st.session_state.chat_history = ChatHistory(messages)
+    st.session_state.conversation_id = conversation_id
+    st.session_state.chat_export = None
+    start_new_thread()  # the loaded history is posted to it before the next run
     st.session_state.welcome_message_displayed = True
-    st.experimental_rerun()
-
-def export_chat():
-    chat_text = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in st.session_state.chat_history])
-    b64 = base64.b64encode(chat_text.encode()).decode()
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"chat_export_{timestamp}.txt"
-    href = f'<a href="data:file/txt;base64,{b64}" download="{filename}">Download Chat History</a>'
-    return href
+    st.rerun()
+
+def request_export(fmt):
+    # Produced only when asked for; PDFs are built in the background
+    history = st.session_state.chat_history
+    st.session_state.chat_export = (fmt, transcript_digest(history), export_chat(fmt, history, resources.pdf_export.get()))
+
+@st.experimental_fragment(run_every=1)
+def wait_for_export():
+    # Only this fragment reruns while the export is built, so the chat stays usable
+    export = st.session_state.get("chat_export")
+    if export is None or export[2].done():
+        st.rerun()
+    st.caption("Preparing export...")
+
+def show_export():
+    fmt = st.selectbox("Export format", list(EXPORT_FORMATS), label_visibility="collapsed")
+    if st.button("Export"):
+        request_export(fmt)
+    if st.session_state.get("chat_export") is None:
+        return
+    fmt, key, future = st.session_state.chat_export
+    if key != transcript_digest(st.session_state.chat_history):
+        # Out of date; dropped so it isn't resent with every rerun
+        st.session_state.chat_export = None
+        return
+    if not future.done():
+        wait_for_export()
+        return
+    try:
+        document = future.result()
+    except Exception as e:
+        st.session_state.chat_export = None
+        st.error(f"Export failed: {e}")
+        return
+    st.download_button(
+        label=f"Download {fmt}",
+        data=document.read(),
+        file_name=export_filename(fmt),
+        mime=EXPORT_FORMATS[fmt].mime
+    )
 
 def show_info():
     st.markdown("""
@@ -220,40 +294,44 @@ def main():
     with chat_container:
         st.subheader(st.session_state.welcome_subheader)
         
-        st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-        for message in st.session_state.chat_history:
-            if message['role'] == 'assistant':
-                st.markdown(f'<div class="message-container" style="display: flex; justify-content: flex-end;"><div class="assistant-message">{message["content"]}</div></div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<div class="message-container" style="display: flex; justify-content: flex-start;"><div class="user-message">{message["content"]}</div></div>', unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        renderer = st.session_state.chat_renderer.sync(st.session_state.chat_history)
+        if renderer.hidden_count():
+            if st.button(f"Show earlier messages ({renderer.hidden_count()} hidden)"):
+                renderer.show_more()
+        st.markdown(f'<div class="chat-container">{renderer.window_html()}</div>', unsafe_allow_html=True)
 
     with input_container:
-        user_input = st.chat_input("Type your message...", key="user_input")
+        # A session past its memory ceiling can still be saved, summarized
+        # and reviewed, but takes no new messages
+        at_limit = sum(session_memory(st.session_state).values()) >= SESSION_MEMORY_LIMIT
+        if at_limit:
+            st.warning("This conversation has reached its size limit. Save it and start over to continue.")
+        user_input = st.chat_input("Type your message...", key="user_input", disabled=at_limit)
 
         if user_input:
             st.session_state.chat_history.append({"role": "user", "content": user_input})
-            add_message_to_thread(user_input)
+            sync_thread()
 
-            with st.spinner("Thinking..."):
-                assistant_response = run_assistant()
+            with streaming_container:
+                message_placeholder = st.empty()
+                with st.spinner("Thinking..."):
+                    assistant_response = stream_assistant_response(message_placeholder)
 
             if assistant_response:
-                with streaming_container:
-                    message_placeholder = st.empty()
-                    full_response = ""
-                    for chunk in stream_response(assistant_response):
-                        message_placeholder.markdown(f'<div class="message-container" style="display: flex; justify-content: flex-end;"><div class="assistant-message">{chunk}</div></div>', unsafe_allow_html=True)
-                        time.sleep(0.05)
-                    full_response = chunk
-                st.session_state.chat_history.append({"role": "assistant", "content": full_response})
+                add_assistant_response(assistant_response)
 
-            st.experimental_rerun()
+            st.rerun()
 
     with controls_container:
         if st.session_state.get("chat_history"):
-            sentiment = analyze_sentiment(" ".join(msg["content"] for msg in st.session_state["chat_history"]))
+            sentiment = st.session_state.sentiment_store.sync(st.session_state["chat_history"]).overall()
             st.write(f'Sentiment: {sentiment:.2f}')
+            st.caption(OVERALL_NOTE)
+
+        token_usage = st.session_state.token_usage
+        if token_usage.totals:
+            with st.expander(f"Token usage: {token_usage.total():,} tokens"):
+                st.table(token_usage.report())
 
         # Buttons for functionality in a row
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -270,7 +348,7 @@ def main():
             if st.button("Review Readiness"):
                 rate_readiness()
         with col5:
-            st.markdown(export_chat(), unsafe_allow_html=True)
+            show_export()
 
         # Saved chats dropdown
         saved_chats = get_saved_chats()
@@ -285,3 +363,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    resources.preload(resources.openai_client, resources.sentiment_analyzer)
@@ -1,17 +1,10 @@
 import streamlit as st
-import openai
-from openai import OpenAI
-import time
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-import uuid
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from io import BytesIO
-
-# Initialize NLTK
-nltk.download('vader_lexicon', quiet=True)
+
+from chat_export import transcript_digest
+import resources
+import run_waiter
+from run_waiter import RunWaiter
+from sentiment import OVERALL_NOTE, SentimentStore
 
 # Streamlit configuration
 st.set_page_config(page_title="Motivational Interviewing Chatbot", layout="wide")
@@ -64,6 +57,8 @@ st.markdown(f"""
 # Initialize session state
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+if "sentiment_store" not in st.session_state:
+    st.session_state.sentiment_store = SentimentStore()
 if "thread_id" not in st.session_state:
     st.session_state.thread_id = None
 if "confidence" not in st.session_state:
@@ -74,7 +69,8 @@ if "user_input" not in st.session_state:
     st.session_state.user_input = ""
 
 # Initialize OpenAI client
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+client = resources.openai_client.lazy()
+waiter = RunWaiter(client)
 
 # Pre-configured Assistant ID
 ASSISTANT_ID = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"
@@ -94,40 +90,52 @@ def add_message_to_thread(content):
 
 def run_assistant():
     create_thread_if_not_exists()
-    run = client.beta.threads.runs.create(
-        thread_id=st.session_state.thread_id,
-        assistant_id=ASSISTANT_ID
-    )
-    
-    while True:
-        run_status = client.beta.threads.runs.retrieve(
-            thread_id=st.session_state.thread_id,
-            run_id=run.id
-        )
-        if run_status.status == 'completed':
-            break
-        elif run_status.status == 'failed':
-            st.error(f"Run failed: {run_status.last_error}")
-            return None
-        time.sleep(1)
-    
-    messages = client.beta.threads.messages.list(
-        thread_id=st.session_state.thread_id
+    response, stats = run_waiter.run_assistant(
+        client,
+        st.session_state.thread_id,
+        ASSISTANT_ID,
+        waiter=waiter
     )
-    
-    return messages.data[0].content[0].text.value
-
-def analyze_sentiment(text):
-    sia = SentimentIntensityAnalyzer()
-    return sia.polarity_scores(text)['compound']
+    if response is None:
+        st.error(f"Run {stats['status']}: {stats['last_error']}")
+    return response
 
 def export_to_pdf():
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    flowables = [Paragraph(f"{msg['role'].capitalize()}: {msg['content']}", styles['Normal']) for msg in st.session_state.chat_history]
-    doc.build(flowables)
-    return buffer.getvalue()
+    # Built on a worker; show_pdf_export() offers it once it's ready
+    history = st.session_state.chat_history
+    st.session_state.pdf_export = (transcript_digest(history), resources.pdf_export.get().submit(history))
+
+@st.experimental_fragment(run_every=1)
+def wait_for_pdf_export():
+    # Only this fragment reruns while the PDF is built, so the chat stays usable
+    export = st.session_state.get("pdf_export")
+    if export is None or export[1].done():
+        st.rerun()
+    st.caption("Preparing PDF...")
+
+def show_pdf_export():
+    if st.session_state.get("pdf_export") is None:
+        return
+    key, future = st.session_state.pdf_export
+    if key != transcript_digest(st.session_state.chat_history):
+        # The chat has moved on; dropped so the old PDF isn't resent with every rerun
+        st.session_state.pdf_export = None
+        return
+    if not future.done():
+        wait_for_pdf_export()
+        return
+    try:
+        document = future.result()
+    except Exception as e:
+        st.session_state.pdf_export = None
+        st.error(f"PDF export failed: {e}")
+        return
+    st.download_button(
+        label="Download PDF",
+        data=document.read(),
+        file_name="conversation_summary.pdf",
+        mime="application/pdf"
+    )
 
 def on_confidence_change():
     st.session_state.chat_history.append({"role": "user", "content": f"Confidence in ability to change: {st.session_state.confidence}"})
@@ -165,8 +173,9 @@ def main():
         st.markdown("<h3 style='font-size: 18px;'>Metrics</h3>", unsafe_allow_html=True)
         
         if st.session_state.chat_history:
-            sentiment = analyze_sentiment(" ".join(msg["content"] for msg in st.session_state.chat_history))
+            sentiment = st.session_state.sentiment_store.sync(st.session_state.chat_history).overall()
             st.markdown(f'<div class="sentiment-box">Sentiment: {sentiment:.2f}</div>', unsafe_allow_html=True)
+            st.caption(OVERALL_NOTE)
         
         st.markdown('<p class="metric-label">Confidence in ability to change:</p>', unsafe_allow_html=True)
         st.slider("", 0, 10, key="confidence", on_change=on_confidence_change)
@@ -175,13 +184,8 @@ def main():
         st.slider("", 0, 10, key="importance", on_change=on_importance_change)
         
         if st.button("Export to PDF", key="export_button"):
-            pdf = export_to_pdf()
-            st.download_button(
-                label="Download PDF",
-                data=pdf,
-                file_name="conversation_summary.pdf",
-                mime="application/pdf"
-            )
+            export_to_pdf()
+        show_pdf_export()
 
     with col2:
         st.subheader("Chat")
@@ -198,3 +202,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    resources.preload(resources.openai_client, resources.sentiment_analyzer)
@@ -1,22 +1,17 @@
 import streamlit as st
-import openai
-from openai import OpenAI
-import time
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-from io import BytesIO
-import re
 import random
-import logging
-import json
-from datetime import datetime
-import os
+import uuid
 
-# Initialize logging
-logging.basicConfig(level=logging.DEBUG)
+from chat_history import SESSION_MEMORY_LIMIT, ChatHistory, session_memory
+from chat_render import ChatRenderer, message_card_html
+import rate_limits
+import resources
+import run_waiter
+from run_waiter import RunWaiter
+from sentiment import OVERALL_NOTE, SentimentStore
 
-# Initialize NLTK
-nltk.download('vader_lexicon', quiet=True)
+# Initialize logging
+resources.configure_logging()
 
 # Streamlit configuration
 st.set_page_config(page_title="Motivational Interviewing Chatbot", layout="wide")
@@ -24,7 +19,11 @@ st.set_page_config(page_title="Motivational Interviewing Chatbot", layout="wide"
 # Initialize session state
 def initialize_session_state():
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+        st.session_state.chat_history = ChatHistory()
+    if "sentiment_store" not in st.session_state:
+        st.session_state.sentiment_store = SentimentStore()
+    if "chat_renderer" not in st.session_state:
+        st.session_state.chat_renderer = ChatRenderer(message_card_html)
     if "thread_id" not in st.session_state:
         st.session_state.thread_id = None
     if "confidence" not in st.session_state:
@@ -35,6 +34,10 @@ def initialize_session_state():
         st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"
     if "welcome_message_displayed" not in st.session_state:
         st.session_state.welcome_message_displayed = False
+    if "conversation_id" not in st.session_state:
+        st.session_state.conversation_id = None
+    if "owner_id" not in st.session_state:
+        st.session_state.owner_id = uuid.uuid4().hex  # saves are listed and loaded by this session only
 
 initialize_session_state()
 
@@ -104,7 +107,8 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 # Initialize OpenAI client
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+client = resources.openai_client.lazy()
+waiter = RunWaiter(client)
 
 def create_thread_if_not_exists():
     if not st.session_state.thread_id:
@@ -121,32 +125,36 @@ def add_message_to_thread(content):
 
 def run_assistant():
     create_thread_if_not_exists()
-    run = client.beta.threads.runs.create(
-        thread_id=st.session_state.thread_id,
-        assistant_id=st.session_state.current_assistant_id
+    response, stats = run_waiter.run_assistant(
+        client,
+        st.session_state.thread_id,
+        st.session_state.current_assistant_id,
+        waiter=waiter
     )
-    
-    while True:
-        run_status = client.beta.threads.runs.retrieve(
+    if response is None:
+        st.error(f"Run {stats['status']}: {stats['last_error']}")
+    return response
+
+def run_analysis():
+    # Summarize and Review Readiness. An analysis of the same transcript is
+    # answered from the process-wide cache without a run; the answer is still
+    # posted to the thread so it stays in step with the chat.
+    cache = resources.response_cache.get()
+    cache_key = cache.key(st.session_state.current_assistant_id, st.session_state.chat_history)
+    response = cache.get(cache_key)
+    if response is not None:
+        create_thread_if_not_exists()
+        client.beta.threads.messages.create(
             thread_id=st.session_state.thread_id,
-            run_id=run.id
+            role="assistant",
+            content=response
         )
-        if run_status.status == 'completed':
-            break
-        elif run_status.status == 'failed':
-            st.error(f"Run failed: {run_status.last_error}")
-            return None
-        time.sleep(1)
-    
-    messages = client.beta.threads.messages.list(
-        thread_id=st.session_state.thread_id
-    )
-    
-    return messages.data[0].content[0].text.value
-
-def analyze_sentiment(text):
-    sia = SentimentIntensityAnalyzer()
-    return sia.polarity_scores(text)['compound']
+        return response
+    with rate_limits.priority(rate_limits.ANALYSIS):
+        response = run_assistant()
+    if response:
+        cache.put(cache_key, response)
+    return response
 
 def on_slider_change(slider_type):
     if slider_type == "importance":
@@ -163,47 +171,49 @@ def on_slider_change(slider_type):
     if assistant_response:
         st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
     
-    st.experimental_rerun()
+    st.rerun()
 
 def rate_readiness():
     st.session_state.current_assistant_id = "asst_u4tbCd0KubyMYfKeD59bBxjM"
-    assistant_response = run_assistant()
+    assistant_response = run_analysis()
     if assistant_response:
         st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
     st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"  # Reset to main assistant
-    st.experimental_rerun()
+    st.rerun()
 
 def summarize_conversation():
     st.session_state.current_assistant_id = "asst_2IN1dkowoziRpYyzSdgJbPZY"
-    assistant_response = run_assistant()
+    assistant_response = run_analysis()
     if assistant_response:
         st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
     st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"  # Reset to main assistant
-    st.experimental_rerun()
-
-def continue_conversation():
-    st.experimental_rerun()
+    st.rerun()
 
 def reset_chat():
-    st.session_state.chat_history = []
+    st.session_state.chat_history = ChatHistory()
+    st.session_state.conversation_id = None
     st.session_state.welcome_message_displayed = False
-    st.experimental_rerun()
+    st.rerun()
 
 def save_chat():
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"chat_history_{timestamp}.json"
-    with open(filename, "w") as f:
-        json.dump(st.session_state.chat_history, f)
-    st.success(f"Chat history saved as {filename}")
+    store = resources.chat_store.get()
+    if not st.session_state.conversation_id:
+        st.session_state.conversation_id = store.new_conversation()
+    store.save(st.session_state.conversation_id, st.session_state.chat_history, owner_id=st.session_state.owner_id)
+    st.success(f"Chat history saved")
 
 def get_saved_chats():
-    return [f for f in os.listdir(".") if f.startswith("chat_history_") and f.endswith(".json")]
-
-def load_chat(filename):
-    with open(filename, "r") as f:
-        st.session_state.chat_history = json.load(f)
+    return resources.chat_store.get().list_saves(owner_id=st.session_state.owner_id)
+
+def load_chat(chat_data):
+    messages, conversation_id = resources.chat_store.get().load_save(chat_data['save_id'], owner_id=st.session_state.owner_id)
+    if messages is None:
+        st.error("That saved chat isn't available.")
+        return
+    st.session_state.chat_history = ChatHistory(messages)
+    st.session_state.conversation_id = conversation_id
     st.session_state.welcome_message_displayed = True
-    st.experimental_rerun()
+    st.rerun()
 
 welcome_messages = [
     "Hi there! I'm a coach specializing in motivational interviewing. What change are you considering?",
@@ -227,21 +237,18 @@ def main():
             st.session_state.setdefault("chat_history", []).append({"role": "assistant", "content": welcome_message})
             st.session_state["welcome_message_displayed"] = True
 
-        for i, message in enumerate(st.session_state["chat_history"]):
-            if message['role'] == 'assistant':
-                st.markdown(f"""
-                    <div class="chat-message assistant-message">
-                        🐙 {message['content']}
-                    </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                    <div class="chat-message user-message">
-                        <b>You:</b> {message['content']}
-                    </div>
-                """, unsafe_allow_html=True)
-
-        user_input = st.chat_input("Type your message...", key="user_input")
+        renderer = st.session_state.chat_renderer.sync(st.session_state["chat_history"])
+        if renderer.hidden_count():
+            if st.button(f"Show earlier messages ({renderer.hidden_count()} hidden)"):
+                renderer.show_more()
+        st.markdown(renderer.window_html(), unsafe_allow_html=True)
+
+        # A session past its memory ceiling can still be saved, summarized
+        # and reviewed, but takes no new messages
+        at_limit = sum(session_memory(st.session_state).values()) >= SESSION_MEMORY_LIMIT
+        if at_limit:
+            st.warning("This conversation has reached its size limit. Save it and start over to continue.")
+        user_input = st.chat_input("Type your message...", key="user_input", disabled=at_limit)
 
         if user_input:
             st.session_state["chat_history"].append({"role": "user", "content": user_input})
@@ -253,14 +260,15 @@ def main():
             if assistant_response:
                 st.session_state["chat_history"].append({"role": "assistant", "content": assistant_response})
 
-            st.experimental_rerun()
+            st.rerun()
 
     with controls_container:
         st.markdown("<h3 style='font-size: 18px;'>Metrics</h3>", unsafe_allow_html=True)
 
         if st.session_state.get("chat_history"):
-            sentiment = analyze_sentiment(" ".join(msg["content"] for msg in st.session_state["chat_history"]))
+            sentiment = st.session_state.sentiment_store.sync(st.session_state["chat_history"]).overall()
             st.markdown(f'<div class="sentiment-box">Sentiment: {sentiment:.2f}</div>', unsafe_allow_html=True)
+            st.caption(OVERALL_NOTE)
 
         # Buttons row
         st.markdown("""
@@ -304,3 +312,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    resources.preload(resources.openai_client, resources.sentiment_analyzer)
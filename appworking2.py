@@ -1,19 +1,16 @@
 import streamlit as st
-import openai
-from openai import OpenAI
 import time
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-from io import BytesIO
-import re
 import random
 import logging
 
-# Initialize logging
-logging.basicConfig(level=logging.DEBUG)
+import rate_limits
+import resources
+import run_waiter
+from run_waiter import RunWaiter
+from sentiment import OVERALL_NOTE, SentimentStore
 
-# Initialize NLTK
-nltk.download('vader_lexicon', quiet=True)
+# Initialize logging
+resources.configure_logging()
 
 # Streamlit configuration
 st.set_page_config(page_title="Motivational Interviewing Chatbot", layout="wide")
@@ -22,6 +19,8 @@ st.set_page_config(page_title="Motivational Interviewing Chatbot", layout="wide"
 def initialize_session_state():
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
+    if "sentiment_store" not in st.session_state:
+        st.session_state.sentiment_store = SentimentStore()
     if "thread_id" not in st.session_state:
         st.session_state.thread_id = None
     if "confidence" not in st.session_state:
@@ -95,7 +94,8 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 # Initialize OpenAI client
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+client = resources.openai_client.lazy()
+waiter = RunWaiter(client)
 
 def create_thread_if_not_exists():
     if not st.session_state.thread_id:
@@ -112,40 +112,40 @@ def add_message_to_thread(content):
 
 def run_assistant():
     create_thread_if_not_exists()
-    run = client.beta.threads.runs.create(
-        thread_id=st.session_state.thread_id,
-        assistant_id=st.session_state.current_assistant_id
+    response, stats = run_waiter.run_assistant(
+        client,
+        st.session_state.thread_id,
+        st.session_state.current_assistant_id,
+        waiter=waiter
     )
-    
-    while True:
-        run_status = client.beta.threads.runs.retrieve(
+    if response is None:
+        st.error(f"Run {stats['status']}: {stats['last_error']}")
+    return response
+
+def run_analysis():
+    # Summarize and Review Readiness. An analysis of the same transcript is
+    # answered from the process-wide cache without a run; the answer is still
+    # posted to the thread so it stays in step with the chat.
+    cache = resources.response_cache.get()
+    cache_key = cache.key(st.session_state.current_assistant_id, st.session_state.chat_history)
+    response = cache.get(cache_key)
+    if response is not None:
+        create_thread_if_not_exists()
+        client.beta.threads.messages.create(
             thread_id=st.session_state.thread_id,
-            run_id=run.id
+            role="assistant",
+            content=response
         )
-        if run_status.status == 'completed':
-            break
-        elif run_status.status == 'failed':
-            st.error(f"Run failed: {run_status.last_error}")
-            return None
-        time.sleep(1)
-    
-    messages = client.beta.threads.messages.list(
-        thread_id=st.session_state.thread_id
-    )
-    
-    return messages.data[0].content[0].text.value
-
-def analyze_sentiment(text):
-    sia = SentimentIntensityAnalyzer()
-    return sia.polarity_scores(text)['compound']
+        return response
+    with rate_limits.priority(rate_limits.ANALYSIS):
+        response = run_assistant()
+    if response:
+        cache.put(cache_key, response)
+    return response
 
 def export_to_pdf():
-    buffer = BytesIO()
-    styles = getSampleStyleSheet()
-    flowables = [Paragraph(f"{msg['role'].capitalize()}: {msg['content']}", styles['Normal']) for msg in st.session_state.chat_history]
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    doc.build(flowables)
-    return buffer.getvalue()
+    # Future of the ExportDocument, built and cached off the script thread
+    return resources.pdf_export.get().submit(st.session_state.chat_history)
 
 def check_for_importance_slider(text):
     return "On a scale from 0 to 10, how important" in text
@@ -177,29 +177,29 @@ def on_slider_change(slider_type):
     if assistant_response:
         st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
     
-    st.experimental_rerun()
+    st.rerun()
 
 def rate_readiness():
     st.session_state.current_assistant_id = "asst_u4tbCd0KubyMYfKeD59bBxjM"
-    assistant_response = run_assistant()
+    assistant_response = run_analysis()
     if assistant_response:
         st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
     st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"  # Reset to main assistant
     st.session_state.show_readiness_button = False  # Hide the button after use
-    st.experimental_rerun()
+    st.rerun()
 
 def summarize_conversation():
     st.session_state.current_assistant_id = "asst_2IN1dkowoziRpYyzSdgJbPZY"
-    assistant_response = run_assistant()
+    assistant_response = run_analysis()
     if assistant_response:
         st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
     st.session_state.current_assistant_id = "asst_RAJ5HUmKrqKXAoBDhacjvMy8"  # Reset to main assistant
     st.session_state.show_summary_options = False
-    st.experimental_rerun()
+    st.rerun()
 
 def continue_conversation():
     st.session_state.show_summary_options = False
-    st.experimental_rerun()
+    st.rerun()
 
 def display_sliders():
     slider_placeholder = st.empty()
@@ -213,7 +213,7 @@ def display_sliders():
                 on_slider_change("importance")
                 slider_placeholder.empty()
                 time.sleep(0.5)
-                st.experimental_rerun()
+                st.rerun()
 
     if st.session_state.show_confidence_slider:
         with slider_placeholder:
@@ -225,7 +225,7 @@ def display_sliders():
                 on_slider_change("confidence")
                 slider_placeholder.empty()
                 time.sleep(0.5)
-                st.experimental_rerun()
+                st.rerun()
 
 def process_messages():
     for i, message in enumerate(st.session_state.chat_history):
@@ -288,8 +288,9 @@ def main():
         st.markdown("<h3 style='font-size: 18px;'>Metrics</h3>", unsafe_allow_html=True)
 
         if st.session_state.chat_history:
-            sentiment = analyze_sentiment(" ".join(msg["content"] for msg in st.session_state.chat_history))
+            sentiment = st.session_state.sentiment_store.sync(st.session_state.chat_history).overall()
             st.markdown(f'<div class="sentiment-box">Sentiment: {sentiment:.2f}</div>', unsafe_allow_html=True)
+            st.caption(OVERALL_NOTE)
 
         if st.session_state.show_readiness_button:
             st.button("Rate my readiness to change", on_click=rate_readiness, key="rate_readiness", type="primary")
@@ -333,7 +334,8 @@ def main():
             slider_placeholder = st.empty()
             slider_placeholder.empty()
             time.sleep(0.5)
-            st.experimental_rerun()
+            st.rerun()
 
 if __name__ == "__main__":
     main()
+    resources.preload(resources.openai_client, resources.sentiment_analyzer)
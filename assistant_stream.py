@@ -0,0 +1,70 @@
+import time
+
+from metrics import span
+from run_waiter import RunTimeout, RunWaiter
+
+# How often (in seconds) the placeholder is redrawn while tokens arrive.
+# Redrawing on every delta floods the websocket without looking any smoother.
+RENDER_INTERVAL = 0.05
+
+
+def stream_assistant(client, thread_id, assistant_id, on_text=None, render_interval=RENDER_INTERVAL, waiter=None, deadline=None):
+    # Start a run with the Assistants event stream and hand the growing
+    # response to on_text as tokens arrive. Returns (response, stats); the
+    # response is None when the run did not complete.
+    #
+    # Like RunWaiter.wait, the run is cancelled when it outlives the waiter's
+    # deadline or the stream is interrupted (in Streamlit, a rerun raised out
+    # of on_text), so it doesn't keep holding the thread. The deadline is
+    # checked as tokens arrive; a stream that stalls outright ends at the
+    # client's read timeout.
+    waiter = waiter or RunWaiter(client)
+    deadline = waiter.deadline if deadline is None else deadline
+    started = time.perf_counter()
+    first_token_at = None
+    last_render = 0.0
+    full_response = ""
+    timed_out = None
+
+    with span("run_stream"), client.beta.threads.runs.stream(
+        thread_id=thread_id,
+        assistant_id=assistant_id
+    ) as stream:
+        try:
+            for delta in stream.text_deltas:
+                now = time.perf_counter()
+                if now - started > deadline:
+                    raise RunTimeout(f"Streamed run did not finish within {deadline}s")
+                if first_token_at is None:
+                    first_token_at = now
+                full_response += delta
+                if on_text and now - last_render >= render_interval:
+                    on_text(full_response)
+                    last_render = now
+        except BaseException as e:
+            if stream.current_run is not None:
+                waiter.cancel(thread_id, stream.current_run.id)
+            if not isinstance(e, RunTimeout):
+                raise
+            timed_out = e
+        run = stream.current_run
+
+    finished = time.perf_counter()
+    if on_text and full_response:
+        on_text(full_response)
+
+    stats = {
+        "run_id": run.id if run else None,
+        "status": run.status if run else None,
+        "last_error": run.last_error if run else None,
+        "usage": run.usage if run else None,
+        "time_to_first_token": (first_token_at - started) if first_token_at else None,
+        "total": finished - started,
+    }
+    if timed_out is not None:
+        # Our deadline, as opposed to the API's own 'expired' status
+        stats.update(status='timed_out', last_error=str(timed_out))
+        return None, stats
+    if run is None or run.status != 'completed':
+        return None, stats
+    return full_response, stats
@@ -0,0 +1,63 @@
+# Cold-start time of the sentiment analyzer: nltk.download() plus the stock
+# SentimentIntensityAnalyzer versus the packaged offline lexicon. Each sample
+# runs in a fresh interpreter so nothing is cached between runs. Importing
+# nltk itself costs the same in both modes and is kept out of the timing.
+#
+# Without network access nltk.download() fails fast only if DNS does; behind
+# a firewall that drops packets it waits for the connect timeout instead.
+#
+#   python benchmarks/cold_start.py --repeat 5
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "nltk.download": (
+        "nltk.download('vader_lexicon', quiet=True)\n"
+        "SentimentIntensityAnalyzer().polarity_scores('ok')\n"
+    ),
+    "offline lexicon": (
+        "from sentiment import load_offline_analyzer\n"
+        "load_offline_analyzer().polarity_scores('ok')\n"
+    ),
+}
+
+TIMER = (
+    "import time\n"
+    "import nltk\n"
+    "from nltk.sentiment import SentimentIntensityAnalyzer\n"
+    "started = time.perf_counter()\n"
+    "{body}"
+    "print(time.perf_counter() - started)\n"
+)
+
+
+def sample(body):
+    result = subprocess.run(
+        [sys.executable, "-c", TIMER.format(body=body)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sentiment analyzer cold start")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<18}{'median (ms)':>14}{'max (ms)':>12}")
+    for name, body in MODES.items():
+        try:
+            samples = [sample(body) * 1000 for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"{name:<18}{'failed':>14}  {e.stderr.strip().splitlines()[-1]}")
+            continue
+        print(f"{name:<18}{statistics.median(samples):>14.1f}{max(samples):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
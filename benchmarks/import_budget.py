@@ -0,0 +1,98 @@
+# Import-time budget for the app scripts. Runs each app's top-level imports
+# in a fresh interpreter, after importing streamlit (which the server has
+# loaded before any script runs), and fails when they take longer than the
+# budget or pull in a dependency that should only load on first use.
+#
+#   python benchmarks/import_budget.py
+#   python benchmarks/import_budget.py --budget-ms 150 --repeat 5 app.py
+#
+# Exits with status 1 when any app is over budget or its imports fail.
+# tests/test_import_budget.py runs the same check for each app under pytest.
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPS = ("app.py", "appVHLWORKING.py", "appsliders.py", "appworking2.py", "appWORKING.py")
+
+# Only needed once a message is sent, a chart drawn or a PDF exported
+LAZY_PACKAGES = ("openai", "nltk", "plotly", "reportlab", "pypdf")
+
+TIMER = (
+    "import json, sys, time\n"
+    "import streamlit\n"
+    "before = set(sys.modules)\n"
+    "started = time.perf_counter()\n"
+    "{imports}\n"
+    "elapsed = time.perf_counter() - started\n"
+    "loaded = sorted(set(sys.modules) - before)\n"
+    "print(json.dumps({{'seconds': elapsed, 'modules': loaded}}))\n"
+)
+
+
+def top_level_imports(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    return "\n".join(
+        ast.unparse(node) for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and not (
+            isinstance(node, ast.Import) and all(alias.name == "streamlit" for alias in node.names)
+        )
+    )
+
+
+class ImportFailed(Exception):
+    pass
+
+
+def sample(imports):
+    result = subprocess.run(
+        [sys.executable, "-c", TIMER.format(imports=imports)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise ImportFailed(result.stderr.strip() or f"exited with status {result.returncode}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the app scripts' import time against a budget")
+    parser.add_argument("apps", nargs="*", default=APPS)
+    parser.add_argument("--budget-ms", type=float, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    failures = []
+    print(f"{'app':<20}{'median (ms)':>14}{'modules':>10}  eager heavy imports")
+    for app in args.apps:
+        imports = top_level_imports(os.path.join(ROOT, app))
+        try:
+            samples = [sample(imports) for _ in range(args.repeat)]
+        except ImportFailed as e:
+            print(f"{app:<20}{'failed':>14}")
+            failures.append(f"{app}: imports failed:\n{e}")
+            continue
+        milliseconds = statistics.median(s['seconds'] for s in samples) * 1000
+        modules = samples[-1]['modules']
+        eager = sorted({name.split('.')[0] for name in modules} & set(LAZY_PACKAGES))
+        print(f"{app:<20}{milliseconds:>14.1f}{len(modules):>10}  {', '.join(eager) or '-'}")
+        if milliseconds > args.budget_ms:
+            failures.append(f"{app}: imports took {milliseconds:.1f} ms, budget {args.budget_ms:.0f} ms")
+        if eager:
+            failures.append(f"{app}: imports {', '.join(eager)} at startup")
+
+    if failures:
+        print(f"{len(failures)} budget failure(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
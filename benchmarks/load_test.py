@@ -0,0 +1,317 @@
+# Load test for one Streamlit worker running an app variant. Starts the mock
+# Assistants API (mock_assistants_server.py) and `streamlit run <app>` as
+# subprocesses, then drives N concurrent simulated users over Streamlit's own
+# websocket protocol through the chat, Summarize and Review Readiness flows.
+#
+#   python benchmarks/load_test.py --users 1 5 10 25 --turns 5
+#   python benchmarks/load_test.py --app appsliders.py --queue-latency lognormal:1,0.5
+#
+# Each user sends --turns chat messages, then presses Summarize and Review
+# Readiness. A turn's latency runs from sending the widget event to the end of
+# the script run it causes (including any st.rerun);
+# readiness_chart is the time until the readiness chart arrives. Memory per
+# session is the worker's resident set growth over an idle baseline divided by
+# the number of users. Needs streamlit, tornado (ships with streamlit) and
+# Linux /proc for the memory figures.
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_assistants_server import parse_distribution
+
+USER_MESSAGES = [
+    "I've been thinking about cutting down on drinking.",
+    "I want to get more exercise but I never find the time.",
+    "Maybe I could start walking to work a couple of days a week.",
+    "I already started going to bed earlier and it helps.",
+    "I don't know if I can keep it up when work gets busy.",
+    "I plan to cook at home more often next month.",
+]
+ACTIONS = ("chat", "summarize", "readiness")
+FLOWS = ACTIONS + ("readiness_chart",)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def rss_bytes(pid):
+    # Resident set size of a process, or None where /proc isn't available
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of the raw samples
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Session:
+    # One browser tab: a websocket to the worker that tracks the widgets of
+    # the latest script run so it can press buttons and send chat input
+    def __init__(self, url):
+        self.url = url
+        self.connection = None
+        self.widgets = {}
+        self.chat_input_id = None
+        self.exceptions = []
+        self.first_seen = {}
+        self._started = time.perf_counter()
+        self._cache = {}
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+        self.connection = await websocket_connect(self.url, subprotocols=["streamlit"])
+        return await self.rerun()
+
+    async def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    async def rerun(self, widget_state=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        if widget_state is not None:
+            message.rerun_script.widget_states.widgets.append(widget_state)
+        self._started = time.perf_counter()
+        self.first_seen = {}
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        await self._read_until_finished()
+        return time.perf_counter() - self._started
+
+    async def press(self, label):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        if label not in self.widgets:
+            raise RuntimeError(f"No button labelled {label!r} in the last run")
+        return await self.rerun(WidgetState(id=self.widgets[label], trigger_value=True))
+
+    async def chat(self, text):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        if self.chat_input_id is None:
+            raise RuntimeError("No chat input in the last run")
+        state = WidgetState(id=self.chat_input_id)
+        state.string_trigger_value.data = text
+        return await self.rerun(state)
+
+    async def _read_until_finished(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        while True:
+            data = await self.connection.read_message()
+            if data is None:
+                raise RuntimeError("Worker closed the connection")
+            message = ForwardMsg()
+            message.ParseFromString(data)
+            kind = message.WhichOneof("type")
+            if kind == "ref_hash":
+                # The worker sends a reference for messages this session has
+                # already received, like the browser's message cache
+                message = self._cache[message.ref_hash]
+                kind = message.WhichOneof("type")
+            elif message.hash and message.metadata.cacheable:
+                self._cache[message.hash] = message
+
+            if kind == "new_session":
+                self.widgets = {}
+                self.chat_input_id = None
+            elif kind == "delta" and message.delta.WhichOneof("type") == "new_element":
+                self._track(message.delta.new_element)
+            elif kind == "script_finished":
+                if message.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    return
+
+    def _track(self, element):
+        # Also note when each kind of element first arrives, so flows can be
+        # timed to what the user sees as well as to the end of the run
+        kind = element.WhichOneof("type")
+        self.first_seen.setdefault(kind, time.perf_counter() - self._started)
+        if kind == "button":
+            self.widgets[element.button.label] = element.button.id
+        elif kind == "chat_input":
+            self.chat_input_id = element.chat_input.id
+        elif kind == "exception":
+            self.exceptions.append(element.exception.message)
+
+
+async def simulated_user(url, turns, think_time, results, rng):
+    session = Session(url)
+    try:
+        await session.connect()
+        for _ in range(turns):
+            await asyncio.sleep(think_time())
+            results["chat"].append(await session.chat(rng.choice(USER_MESSAGES)))
+        await asyncio.sleep(think_time())
+        results["summarize"].append(await session.press("Summarize"))
+        await asyncio.sleep(think_time())
+        results["readiness"].append(await session.press("Review Readiness"))
+        if "plotly_chart" in session.first_seen:
+            results["readiness_chart"].append(session.first_seen["plotly_chart"])
+    except Exception as e:
+        results["errors"].append(f"{type(e).__name__}: {e}")
+    finally:
+        results["errors"].extend(session.exceptions)
+        await session.close()
+
+
+async def run_level(url, users, turns, think_time, pid, seed):
+    results = {flow: [] for flow in FLOWS}
+    results["errors"] = []
+    peak = rss_bytes(pid)
+
+    async def sample_memory():
+        nonlocal peak
+        while True:
+            rss = rss_bytes(pid)
+            if rss is not None and (peak is None or rss > peak):
+                peak = rss
+            await asyncio.sleep(0.2)
+
+    sampler = asyncio.ensure_future(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        simulated_user(url, turns, think_time, results, random.Random(seed + i))
+        for i in range(users)
+    ))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    return results, elapsed, peak
+
+
+def start_worker(app, port, env):
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", os.path.join(ROOT, app),
+            "--server.headless", "true",
+            "--server.port", str(port),
+            "--server.fileWatcherType", "none",
+            "--browser.gatherUsageStats", "false",
+            "--logger.level", "error",
+        ],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test one Streamlit worker against the mock Assistants API")
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--users", type=int, nargs="+", default=(1, 5, 10, 25), help="concurrent users per level")
+    parser.add_argument("--turns", type=int, default=5, help="chat messages per user before Summarize and Review Readiness")
+    parser.add_argument("--think-time", default="uniform:0.5,2", help="pause between a user's actions")
+    parser.add_argument("--queue-latency", default="lognormal:1,0.5", help="mock run queue time")
+    parser.add_argument("--token-latency", default="const:0.02", help="mock time per generated token")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of mock runs that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    think_time = parse_distribution(args.think_time)
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [
+            sys.executable, os.path.join(ROOT, "mock_assistants_server.py"),
+            "--port", str(mock_port),
+            "--queue-latency", args.queue_latency,
+            "--token-latency", args.token_latency,
+            "--failure-rate", str(args.failure_rate),
+        ],
+        stdout=subprocess.DEVNULL
+    )
+    report = []
+    try:
+        print(f"{'users':>6}{'turns/s':>9}{'flow':>17}{'p50 (s)':>9}{'p95 (s)':>9}{'p99 (s)':>9}{'MiB/session':>13}{'errors':>8}")
+        for users in args.users:
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(
+                    os.environ,
+                    OPENAI_API_KEY="mock",
+                    OPENAI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+                    CHAT_DB_PATH=os.path.join(tmp, "chat_history.db"),
+                )
+                port = free_port()
+                worker = start_worker(args.app, port, env)
+                try:
+                    wait_for(f"http://127.0.0.1:{port}/_stcore/health")
+                    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+
+                    # One short session first so imports and shared resources
+                    # are loaded before the baseline is taken
+                    warm_up = asyncio.run(run_level(url, 1, 1, lambda: 0, worker.pid, args.seed))[0]
+                    if warm_up["errors"]:
+                        raise RuntimeError(f"Warm-up session failed: {warm_up['errors'][0]}")
+                    baseline = rss_bytes(worker.pid)
+
+                    results, elapsed, peak = asyncio.run(run_level(url, users, args.turns, think_time, worker.pid, args.seed))
+                finally:
+                    worker.terminate()
+                    worker.wait()
+
+            completed = sum(len(results[action]) for action in ACTIONS)
+            memory = (peak - baseline) / users if peak is not None and baseline is not None else None
+            level = {
+                "users": users,
+                "elapsed": elapsed,
+                "throughput": completed / elapsed if elapsed else 0,
+                "memory_per_session": memory,
+                "errors": results["errors"],
+                "flows": {
+                    flow: {q: percentile(results[flow], q) for q in (50, 95, 99)} | {"count": len(results[flow])}
+                    for flow in FLOWS
+                },
+            }
+            report.append(level)
+
+            for i, flow in enumerate(FLOWS):
+                stats = level["flows"][flow]
+                cells = [f"{stats[q]:>9.2f}" if stats[q] is not None else f"{'-':>9}" for q in (50, 95, 99)]
+                memory_cell = f"{memory / 2 ** 20:>13.2f}" if memory is not None and i == 0 else f"{'':>13}"
+                prefix = f"{users:>6}{level['throughput']:>9.2f}" if i == 0 else " " * 15
+                errors_cell = f"{len(results['errors']):>8}" if i == 0 else ""
+                print(f"{prefix}{flow:>17}{''.join(cells)}{memory_cell}{errors_cell}")
+            for error in results["errors"][:3]:
+                print(f"{'':>6}error: {error}")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
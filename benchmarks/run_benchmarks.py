@@ -0,0 +1,233 @@
+# Benchmarks for the analysis, export and rendering hot paths over synthetic
+# transcripts. Needs no OpenAI credentials and no Streamlit server.
+#
+#   python benchmarks/run_benchmarks.py                  # run and compare with the baseline
+#   python benchmarks/run_benchmarks.py --save-baseline  # record a new baseline
+#   python benchmarks/run_benchmarks.py --sizes 10 100 --only sentiment
+#
+# Baselines are machine specific; record one on the machine you compare on.
+# The run exits with status 1 when a case is slower than its baseline by more
+# than --tolerance.
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import resources
+from assistant_stream import stream_assistant
+from change_talk import load_corpus
+from chat_export import chat_pdf, export_chat
+from chat_render import ChatRenderer, assistant_bubble, message_html
+from sentiment import SentimentStore, get_analyzer
+from streaming_latency import SimulatedClient
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = (10, 100, 1000, 5000)
+
+ASSISTANT_REPLIES = [
+    "That sounds like an important change. What makes it matter to you right now?",
+    "You mentioned feeling unsure. On a scale from 0 to 10, how confident are you?",
+    "It's great that you've already started. What has helped so far?",
+    "What might get in the way, and how could you plan for that?",
+]
+
+# The keyword analyzer app.py used before the corpus matcher, kept as a
+# reference point for the change talk cases
+STAGE_KEYWORDS = {
+    'pre': ['don\'t', 'won\'t', 'can\'t', 'not', 'never', 'no'],
+    'contemplation': ['might', 'maybe', 'consider', 'possibly'],
+    'planning': ['plan', 'intend', 'will', 'going to'],
+    'action': ['doing', 'started', 'began', 'implemented'],
+    'maintenance': ['continuing', 'maintaining', 'kept', 'sustained']
+}
+KEYWORD_STAGES = {keyword: stage for stage, keywords in STAGE_KEYWORDS.items() for keyword in keywords}
+
+
+def synthetic_transcript(turns, seed=0):
+    # Alternating user/assistant messages; user turns quote or paraphrase the
+    # change talk corpus so the analyzers have something to find
+    rng = random.Random(seed)
+    statements = [item['statement'] for item in load_corpus(resources.CHANGE_TALK_PATH) if item.get('statement')]
+    messages = []
+    for _ in range(turns):
+        user = rng.choice(statements)
+        if rng.random() < 0.5:
+            user = f"Honestly, {user[0].lower()}{user[1:]} I keep thinking about it."
+        messages.append({"role": "user", "content": user})
+        messages.append({"role": "assistant", "content": rng.choice(ASSISTANT_REPLIES)})
+    return messages
+
+
+def analyze_keywords(text):
+    words = re.findall(r'\w+', text.lower())
+    stage_counts = Counter(KEYWORD_STAGES[word] for word in words if word in KEYWORD_STAGES)
+
+    total = sum(stage_counts.values())
+    if total == 0:
+        return {stage: 0 for stage in STAGE_KEYWORDS}, 0
+
+    percentages = {stage: (count / total) * 100 for stage, count in stage_counts.items()}
+    score = sum(i * count for i, (stage, count) in enumerate(stage_counts.items())) / total
+    return percentages, score / (len(STAGE_KEYWORDS) - 1)
+
+
+def user_log(messages):
+    return " ".join(msg['content'] for msg in messages if msg['role'] == 'user')
+
+
+def bench_sentiment_joined(messages):
+    # What every rerun used to do: score the whole joined history
+    get_analyzer().polarity_scores(" ".join(msg["content"] for msg in messages))
+
+
+def bench_sentiment_store(messages):
+    # Scoring the whole history once, as on the first rerun after a load
+    SentimentStore().sync(messages)
+
+
+def bench_change_talk_matcher(messages):
+    resources.change_talk_matcher.get().analyze(user_log(messages))
+
+
+def bench_change_talk_keywords(messages):
+    analyze_keywords(user_log(messages))
+
+
+def bench_change_talk_classifier(messages):
+    resources.change_talk_classifier.get().analyze(user_log(messages))
+
+
+def bench_stream_render(messages):
+    # Rendering cost of streaming the last assistant reply token by token
+    tokens = sum(len(msg['content'].split()) for msg in messages[-2:]) * 10
+    client = SimulatedClient(tokens, 0, 0)
+    stream_assistant(client, "thread_bench", "asst_bench", on_text=assistant_bubble, render_interval=0)
+
+
+def bench_export_text(messages):
+    export_chat("TXT", messages, None).result().read()
+
+
+def bench_export_jsonl(messages):
+    export_chat("JSONL", messages, None).result().read()
+
+
+def bench_export_pdf(messages):
+    chat_pdf(messages)
+
+
+def bench_render_history(messages):
+    for message in messages:
+        message_html(message)
+
+
+_renderers = {}
+
+
+def bench_render_window(messages):
+    # Steady-state rerun with the per-session renderer: cached HTML, one page
+    renderer = _renderers.setdefault(id(messages), ChatRenderer())
+    renderer.sync(messages).window_html()
+
+
+# name -> (function, largest transcript it is run on)
+CASES = {
+    "sentiment_joined": (bench_sentiment_joined, None),
+    "sentiment_store": (bench_sentiment_store, None),
+    "change_talk_matcher": (bench_change_talk_matcher, None),
+    "change_talk_keywords": (bench_change_talk_keywords, None),
+    "change_talk_classifier": (bench_change_talk_classifier, None),
+    "stream_render": (bench_stream_render, None),
+    "export_text": (bench_export_text, None),
+    "export_jsonl": (bench_export_jsonl, None),
+    "export_pdf": (bench_export_pdf, 1000),
+    "render_history": (bench_render_history, None),
+    "render_window": (bench_render_window, None),
+}
+
+
+def measure(function, messages, repeat):
+    function(messages)  # warm up shared resources and caches
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(messages)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    function(messages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark analysis, export and rendering hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="transcript sizes in turns")
+    parser.add_argument("--only", nargs="+", help="case names (or prefixes) to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = []
+
+    print(f"{'case':<26}{'turns':>7}{'median (ms)':>14}{'peak (KiB)':>12}{'vs baseline':>14}")
+    for size in args.sizes:
+        messages = synthetic_transcript(size)
+        for name, (function, max_size) in CASES.items():
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            if max_size is not None and size > max_size:
+                continue
+
+            seconds, peak = measure(function, messages, args.repeat)
+            key = f"{name}@{size}"
+            results[key] = {"seconds": seconds, "peak_bytes": peak}
+
+            comparison = ""
+            previous = baseline.get(key)
+            if previous:
+                ratio = seconds / previous["seconds"] if previous["seconds"] else 1
+                comparison = f"{ratio:.2f}x"
+                if ratio > 1 + args.tolerance:
+                    comparison += " !"
+                    regressions.append((key, ratio))
+            print(f"{name:<26}{size:>7}{seconds * 1000:>14.2f}{peak / 1024:>12.1f}{comparison:>14}")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Saved {len(results)} results to {args.baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for key, ratio in regressions:
+            print(f"  {key}: {ratio:.2f}x baseline")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# Compare time-to-first-token and total latency of the old poll-then-replay
+# flow against the Assistants event stream, using a simulated run so no
+# OpenAI credentials are needed.
+#
+#   python benchmarks/streaming_latency.py --tokens 120 --token-delay 0.02
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assistant_stream import stream_assistant
+
+
+class SimulatedRun:
+    # A run that starts producing tokens after queue_delay and then emits one
+    # token every token_delay seconds.
+    def __init__(self, tokens, queue_delay, token_delay):
+        self.tokens = [f"word{i} " for i in range(tokens)]
+        self.queue_delay = queue_delay
+        self.token_delay = token_delay
+        self.started = time.perf_counter()
+
+    @property
+    def duration(self):
+        return self.queue_delay + self.token_delay * len(self.tokens)
+
+    def status(self):
+        done = time.perf_counter() - self.started >= self.duration
+        return 'completed' if done else 'in_progress'
+
+    def text(self):
+        return "".join(self.tokens)
+
+
+class SimulatedStream:
+    def __init__(self, run):
+        self.run = run
+        self.current_run = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_deltas(self):
+        time.sleep(self.run.queue_delay)
+        for token in self.run.tokens:
+            time.sleep(self.run.token_delay)
+            yield token
+        self.current_run = SimpleNamespace(id="run_sim", status='completed', last_error=None, usage=None)
+
+
+class SimulatedClient:
+    def __init__(self, tokens, queue_delay, token_delay):
+        self.settings = (tokens, queue_delay, token_delay)
+        self.run = None
+        runs = SimpleNamespace(create=self._create, retrieve=self._retrieve, stream=self._stream)
+        messages = SimpleNamespace(list=self._list)
+        self.beta = SimpleNamespace(threads=SimpleNamespace(runs=runs, messages=messages))
+
+    def _create(self, thread_id, assistant_id):
+        self.run = SimulatedRun(*self.settings)
+        return SimpleNamespace(id="run_sim")
+
+    def _retrieve(self, thread_id, run_id):
+        return SimpleNamespace(status=self.run.status(), last_error=None, usage=None)
+
+    def _list(self, thread_id):
+        content = SimpleNamespace(text=SimpleNamespace(value=self.run.text()))
+        return SimpleNamespace(data=[SimpleNamespace(content=[content])])
+
+    def _stream(self, thread_id, assistant_id):
+        self.run = SimulatedRun(*self.settings)
+        return SimulatedStream(self.run)
+
+
+def poll_then_replay(client, poll_interval=1.0, word_delay=0.05):
+    # The flow the apps used before: poll runs.retrieve every second, fetch the
+    # finished message, then replay it word by word.
+    started = time.perf_counter()
+    run = client.beta.threads.runs.create(thread_id="thread_sim", assistant_id="asst_sim")
+    while client.beta.threads.runs.retrieve(thread_id="thread_sim", run_id=run.id).status != 'completed':
+        time.sleep(poll_interval)
+    response = client.beta.threads.messages.list(thread_id="thread_sim").data[0].content[0].text.value
+    first_token = None
+    for _ in response.split():
+        if first_token is None:
+            first_token = time.perf_counter() - started
+        time.sleep(word_delay)
+    return first_token, time.perf_counter() - started
+
+
+def streamed(client):
+    _, stats = stream_assistant(client, "thread_sim", "asst_sim", on_text=lambda text: None)
+    return stats["time_to_first_token"], stats["total"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark polled vs streamed assistant runs")
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--queue-delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    client = SimulatedClient(args.tokens, args.queue_delay, args.token_delay)
+    print(f"{'mode':<18}{'first token (s)':>18}{'total (s)':>12}")
+    for name, flow in (("poll + replay", poll_then_replay), ("event stream", streamed)):
+        first_token, total = flow(client)
+        print(f"{name:<18}{first_token:>18.3f}{total:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
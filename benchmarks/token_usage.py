@@ -0,0 +1,84 @@
+# Compare prompt tokens spent on Summarize and Review Readiness when the
+# transcript is re-posted to the thread (the old flow) against running on the
+# existing thread with additional_instructions. Uses the mock Assistants API,
+# whose usage counts every message on the thread as prompt.
+#
+#   python benchmarks/token_usage.py --turns 40 --analyse-every 5
+import argparse
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import run_waiter
+from load_test import USER_MESSAGES
+from metrics import TokenUsage
+from mock_assistants_server import serve
+
+ANALYSES = {
+    "summarize": "Please summarize the conversation so far.",
+    "readiness": "Review the conversation so far for change talk and provide a summary of the user's readiness to change.",
+}
+
+
+def simulate(client, strategy, turns, analyse_every, seed):
+    rng = random.Random(seed)
+    usage = TokenUsage()
+    history = []
+    thread_id = client.beta.threads.create().id
+
+    def run(action, **run_params):
+        response, stats = run_waiter.run_assistant(client, thread_id, f"asst_{action}", **run_params)
+        usage.add(action, stats['usage'])
+        history.append({"role": "assistant", "content": response})
+
+    for turn in range(1, turns + 1):
+        message = rng.choice(USER_MESSAGES)
+        history.append({"role": "user", "content": message})
+        client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
+        run("chat")
+
+        if turn % analyse_every == 0:
+            for action, instructions in ANALYSES.items():
+                if strategy == "reupload":
+                    chat_log = " ".join(f"{msg['role']}: {msg['content']}" for msg in history)
+                    client.beta.threads.messages.create(thread_id=thread_id, role="user", content=f"{instructions}\n{chat_log}")
+                    run(action)
+                else:
+                    run(action, additional_instructions=instructions)
+    return usage
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Token usage of transcript re-upload vs in-thread analysis")
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--analyse-every", type=int, default=5, help="turns between Summarize/Review Readiness clicks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from openai import OpenAI
+    server = serve(port=0, queue_latency="const:0", token_latency="const:0", reply_words=40)
+    client = OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        results = {
+            strategy: simulate(client, strategy, args.turns, args.analyse_every, args.seed)
+            for strategy in ("reupload", "in_thread")
+        }
+    finally:
+        server.shutdown()
+
+    print(f"{args.turns} turns, analyses every {args.analyse_every} turns")
+    print(f"{'strategy':<12}{'action':<12}{'runs':>6}{'prompt tokens':>16}{'total tokens':>15}")
+    for strategy, usage in results.items():
+        for action, totals in usage.report().items():
+            print(f"{strategy:<12}{action:<12}{totals['runs']:>6}{totals['prompt_tokens']:>16,}{totals['total_tokens']:>15,}")
+    before = results["reupload"].total()
+    after = results["in_thread"].total()
+    print(f"Session total: {before:,} -> {after:,} tokens ({1 - after / before:.0%} saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Convert a VADER lexicon text file into the compact JSON shipped with the app,
+# so the sentiment analyzer can start without nltk.download().
+#
+#   python build_vader_lexicon.py [path/to/vader_lexicon.txt]
+#
+# Without an argument the copy in the local nltk_data is used.
+import json
+import sys
+
+from sentiment import VADER_LEXICON_PATH
+
+
+def read_lexicon(path):
+    lexicon = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                word, measure = line.rstrip('\n').split('\t')[0:2]
+                lexicon[word] = float(measure)
+    return lexicon
+
+
+def main():
+    if len(sys.argv) > 1:
+        source = sys.argv[1]
+        lexicon = read_lexicon(source)
+    else:
+        import nltk
+        source = "sentiment/vader_lexicon.zip/vader_lexicon/vader_lexicon.txt"
+        lexicon = {}
+        for line in nltk.data.load(source).split("\n"):
+            word, measure = line.strip().split("\t")[0:2]
+            lexicon[word] = float(measure)
+
+    with open(VADER_LEXICON_PATH, 'w', encoding='utf-8') as f:
+        json.dump(lexicon, f, separators=(',', ':'), sort_keys=True)
+    print(f"Wrote {len(lexicon)} entries from {source} to {VADER_LEXICON_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import json
+import re
+from collections import Counter, deque
+
+STAGE_WEIGHTS = {
+    'pre': 0,
+    'contemplation': 1,
+    'planning': 2,
+    'action': 3,
+    'maintenance': 4
+}
+
+# Most similarity cells (sentences x statements) scored at once; 2M float64
+# cells is 16 MiB, however large the corpus grows
+BATCH_CELLS = 2 ** 21
+
+SENTENCE_END = re.compile(r'\s*[.!?]+\s*')
+WHITESPACE = re.compile(r'[ \t\r\f\v]+')
+
+
+def normalize(text):
+    # Lowercase, turn sentence punctuation into line breaks and collapse
+    # spaces, so corpus statements and transcripts compare the same way.
+    text = SENTENCE_END.sub('\n', text.lower())
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def load_corpus(path='change_talk.json'):
+    # change_talk.json holds one JSON object per line
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ChangeTalkMatcher:
+    # Aho-Corasick automaton over every corpus statement. Built once, then
+    # each transcript is scanned in a single pass regardless of corpus size.
+    # Used by score_transcripts.py and the benchmarks; the app's readiness
+    # review uses StatementClassifier, which also catches paraphrases.
+    def __init__(self, corpus):
+        self.statements = []
+        self.stages = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        patterns = {}
+        for item in corpus:
+            statement = normalize(item.get('statement') or '')
+            if statement:
+                patterns[statement] = item['stage']
+        for statement, stage in patterns.items():
+            self._add(statement, stage)
+        self._build_failure_links()
+
+    @classmethod
+    def from_file(cls, path='change_talk.json'):
+        return cls(load_corpus(path))
+
+    def __len__(self):
+        return len(self.statements)
+
+    def _add(self, statement, stage):
+        node = 0
+        for char in statement:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = next_node
+        self._output[node] = (len(self.statements),)
+        self.statements.append(statement)
+        self.stages.append(stage)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] += self._output[self._fail[child]]
+
+    def find_all(self, text):
+        # Returns non-overlapping (start, end, statement_index) matches that
+        # fall on word boundaries, preferring the leftmost longest statement.
+        text = normalize(text)
+        goto, fail, output = self._goto, self._fail, self._output
+        candidates = []
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in output[node]:
+                start = end - len(self.statements[index])
+                if _on_word_boundary(text, start, end):
+                    candidates.append((start, end, index))
+
+        candidates.sort(key=lambda match: (match[0], match[0] - match[1]))
+        matches = []
+        last_end = 0
+        for start, end, index in candidates:
+            if start >= last_end:
+                matches.append((start, end, index))
+                last_end = end
+        return matches
+
+    def stage_counts(self, text):
+        return Counter(self.stages[index] for _, _, index in self.find_all(text))
+
+    def analyze(self, text):
+        # Returns (normalized_score, stage_percentages) like the original
+        # corpus-based analyze_change_talk
+        return score_stage_counts(self.stage_counts(text))
+
+
+class StatementClassifier:
+    # Nearest-statement classifier over the corpus using TF-IDF weighted
+    # character n-grams, so paraphrases still land near the statements they
+    # resemble. The corpus matrix is built once; each batch of sentences is
+    # scored with a single sparse matrix product.
+    def __init__(self, corpus, ngram_range=(3, 5)):
+        import numpy as np
+        from scipy import sparse
+
+        self.ngram_range = ngram_range
+        patterns = {}
+        for item in corpus:
+            statement = normalize(item.get('statement') or '').replace('\n', ' ')
+            if statement:
+                patterns[statement] = item['stage']
+
+        # Group statements by stage so per-stage maxima are contiguous columns
+        stage_names = sorted(set(patterns.values()), key=lambda stage: STAGE_WEIGHTS.get(stage, len(STAGE_WEIGHTS)))
+        ordered = sorted(patterns.items(), key=lambda item: stage_names.index(item[1]))
+        self.statements = [statement for statement, _ in ordered]
+        self.stages = [stage for _, stage in ordered]
+        self.stage_names = stage_names
+        self._stage_starts = np.searchsorted(
+            np.array([stage_names.index(stage) for stage in self.stages]),
+            np.arange(len(stage_names))
+        )
+
+        self.vocabulary = {}
+        counts = [self._count_ngrams(statement, grow=True) for statement in self.statements]
+        document_frequency = np.zeros(len(self.vocabulary))
+        for grams in counts:
+            document_frequency[list(grams)] += 1
+        self.idf = np.log((1 + len(counts)) / (1 + document_frequency)) + 1
+
+        # Kept column-major so matrix.T is a row-major view and each batch
+        # only walks the n-grams it contains, not the whole corpus
+        self.matrix = self._to_matrix(counts, np, sparse).tocsc()
+        self._np = np
+        self._sparse = sparse
+
+    @classmethod
+    def from_file(cls, path='change_talk.json', **kwargs):
+        return cls(load_corpus(path), **kwargs)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def _count_ngrams(self, text, grow=False):
+        text = f" {text} "
+        vocabulary = self.vocabulary
+        grams = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for start in range(len(text) - n + 1):
+                gram = text[start:start + n]
+                index = vocabulary.get(gram)
+                if index is None:
+                    if not grow:
+                        continue
+                    index = vocabulary[gram] = len(vocabulary)
+                grams[index] = grams.get(index, 0) + 1
+        return grams
+
+    def _to_matrix(self, counts, np, sparse):
+        indptr = [0]
+        indices = []
+        data = []
+        for grams in counts:
+            indices.extend(grams.keys())
+            data.extend(grams.values())
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(counts), len(self.vocabulary))
+        )
+        matrix = matrix @ sparse.diags(self.idf)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+    def similarities(self, sentences):
+        # Cosine similarity of every sentence against every statement
+        counts = [self._count_ngrams(sentence) for sentence in sentences]
+        vectors = self._to_matrix(counts, self._np, self._sparse)
+        return (vectors @ self.matrix.T).toarray()
+
+    def classify(self, sentences, k=1, batch_size=2048):
+        # Returns, for each sentence, up to k (stage, similarity) pairs ordered
+        # by the best-matching statement in each stage. Batches shrink as the
+        # corpus grows so each dense similarity block stays within BATCH_CELLS.
+        np = self._np
+        k = min(k, len(self.stage_names))
+        batch_size = max(1, min(batch_size, BATCH_CELLS // max(1, len(self.statements))))
+        results = []
+        for offset in range(0, len(sentences), batch_size):
+            sims = self.similarities(sentences[offset:offset + batch_size])
+            if not sims.size:
+                results.extend([] for _ in range(sims.shape[0]))
+                continue
+            stage_sims = np.maximum.reduceat(sims, self._stage_starts, axis=1)
+            top = np.argsort(-stage_sims, axis=1)[:, :k]
+            for row, columns in zip(stage_sims, top):
+                results.append([(self.stage_names[column], float(row[column])) for column in columns])
+        return results
+
+    def analyze(self, text, threshold=0.3):
+        # Same (normalized_score, stage_percentages) contract as the exact
+        # matcher; each sentence counts towards its nearest stage when the
+        # similarity clears the threshold
+        sentences = [sentence for sentence in normalize(text).split('\n') if sentence]
+        stage_counts = Counter()
+        for top in self.classify(sentences, k=1):
+            if top and top[0][1] >= threshold:
+                stage_counts[top[0][0]] += 1
+        return score_stage_counts(stage_counts)
+
+
+def score_stage_counts(stage_counts):
+    total_statements = sum(stage_counts.values())
+    if total_statements == 0:
+        return 0, {}
+
+    weighted_sum = sum(STAGE_WEIGHTS[stage] * count for stage, count in stage_counts.items())
+    change_talk_score = weighted_sum / total_statements
+    normalized_score = change_talk_score / max(STAGE_WEIGHTS.values())
+    stage_percentages = {stage: (count / total_statements) * 100 for stage, count in stage_counts.items()}
+
+    return normalized_score, stage_percentages
+
+
+def _on_word_boundary(text, start, end):
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from metrics import counter, histogram, span
+
+# Messages per PDF segment. Segments are rendered once and reused by every
+# later export of a transcript that starts with them; each starts a new page.
+PDF_SEGMENT_MESSAGES = 50
+
+# Finished exports larger than this are kept in a temporary file, not in memory
+SPOOL_BYTES = 2 ** 20
+
+# Bytes handed out per chunk when an export is read back
+CHUNK_BYTES = 64 * 1024
+
+
+def text_chunks(messages):
+    for msg in messages:
+        yield f"{msg['role'].capitalize()}: {msg['content']}\n".encode('utf-8')
+
+
+def jsonl_chunks(messages):
+    for msg in messages:
+        yield (json.dumps({"role": msg['role'], "content": msg['content']}, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+def chat_pdf(messages):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    # Paragraph parses its text as markup, so a stray < or & in a message
+    # would fail the whole export
+    flowables = [Paragraph(f"{msg['role'].capitalize()}: {escape(msg['content'])}", styles['Normal']) for msg in messages]
+    doc.build(flowables)
+    return buffer.getvalue()
+
+
+def transcript_digest(messages):
+    h = hashlib.sha256()
+    for msg in messages:
+        h.update(msg['role'].encode('utf-8'))
+        h.update(b'\0')
+        h.update(msg['content'].encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class ExportDocument:
+    # A finished export. Large ones are spooled to a temporary file, which is
+    # removed once the document is evicted and no session holds it.
+    def __init__(self, file, size, message_count):
+        self.file = file
+        self.size = size
+        self.message_count = message_count
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_chunks(cls, chunks, message_count, spool_bytes=SPOOL_BYTES):
+        file = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        for chunk in chunks:
+            file.write(chunk)
+        return cls(file, file.tell(), message_count)
+
+    def chunks(self, size=CHUNK_BYTES):
+        position = 0
+        while True:
+            with self._lock:
+                self.file.seek(position)
+                chunk = self.file.read(size)
+            if not chunk:
+                return
+            position += len(chunk)
+            yield chunk
+
+    def read(self):
+        return b"".join(self.chunks())
+
+
+class PdfExport:
+    # Process-wide PDF export of chat transcripts. Documents are built on an
+    # executor so a long transcript doesn't hold up the session asking for
+    # it, and cached by transcript hash. A document is merged from segments
+    # of PDF_SEGMENT_MESSAGES messages, so exporting a transcript that has
+    # grown since its last export only renders the segments that changed.
+    def __init__(self, executor, segment_messages=PDF_SEGMENT_MESSAGES, spool_bytes=SPOOL_BYTES,
+                 max_segments=1024, max_documents=64):
+        self.executor = executor
+        self.segment_messages = segment_messages
+        self.spool_bytes = spool_bytes
+        self.max_segments = max_segments
+        self.max_documents = max_documents
+        self._segments = OrderedDict()  # digest of a segment's messages -> PDF bytes
+        self._documents = OrderedDict()  # digest of the transcript -> ExportDocument
+        self._pending = {}  # digest of the transcript -> Future
+        self._lock = threading.Lock()
+        self.segments_rendered = counter("pdf_segments_rendered")
+        self.segments_reused = counter("pdf_segments_reused")
+
+    def submit(self, messages):
+        # Future of the ExportDocument for messages; an export of the same
+        # transcript that is cached or already being built is shared
+        messages = tuple(messages)
+        key = transcript_digest(messages)
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                future = Future()
+                future.set_result(document)
+                return future
+            future = self._pending.get(key)
+            if future is None:
+                future = self.executor.submit(self._build, key, messages)
+                self._pending[key] = future
+            return future
+
+    def _segment(self, messages):
+        key = transcript_digest(messages)
+        with self._lock:
+            segment = self._segments.get(key)
+            if segment is not None:
+                self._segments.move_to_end(key)
+        if segment is not None:
+            self.segments_reused.inc()
+            return segment
+        with span("pdf_segment"):
+            segment = chat_pdf(messages)
+        self.segments_rendered.inc()
+        with self._lock:
+            self._segments[key] = segment
+            while len(self._segments) > self.max_segments:
+                self._segments.popitem(last=False)
+        return segment
+
+    def _build(self, key, messages):
+        from pypdf import PdfWriter
+
+        try:
+            with span("pdf_export"):
+                step = self.segment_messages
+                writer = PdfWriter()
+                for start in range(0, max(len(messages), 1), step):
+                    writer.append(BytesIO(self._segment(messages[start:start + step])))
+                file = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+                writer.write(file)
+                document = ExportDocument(file, file.tell(), len(messages))
+            histogram("pdf_export_bytes", (2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24)).observe(document.size)
+            with self._lock:
+                self._documents[key] = document
+                while len(self._documents) > self.max_documents:
+                    self._documents.popitem(last=False)
+            return document
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "document_bytes": sum(document.size for document in self._documents.values()),
+                "segments": len(self._segments),
+                "pending": len(self._pending),
+                "segments_rendered": self.segments_rendered.value,
+                "segments_reused": self.segments_reused.value,
+            }
+
+
+class ExportFormat:
+    def __init__(self, extension, mime, chunks=None):
+        self.extension = extension
+        self.mime = mime
+        self.chunks = chunks  # None for PDF, which is built by PdfExport
+
+
+EXPORT_FORMATS = {
+    "TXT": ExportFormat("txt", "text/plain", text_chunks),
+    "JSONL": ExportFormat("jsonl", "application/x-ndjson", jsonl_chunks),
+    "PDF": ExportFormat("pdf", "application/pdf"),
+}
+
+
+def export_filename(fmt):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"chat_export_{timestamp}.{EXPORT_FORMATS[fmt].extension}"
+
+
+def export_chat(fmt, messages, pdf_export):
+    # Future of an ExportDocument holding messages in format fmt. Text
+    # formats are written chunk by chunk straight away; PDFs are built in
+    # the background by pdf_export.
+    export_format = EXPORT_FORMATS[fmt]
+    if export_format.chunks is None:
+        return pdf_export.submit(messages)
+    future = Future()
+    with span(f"export_{export_format.extension}"):
+        future.set_result(ExportDocument.from_chunks(export_format.chunks(messages), len(messages)))
+    return future
@@ -0,0 +1,154 @@
+import os
+import sys
+
+# Ceiling on the memory one session may hold before it stops taking new
+# messages; see session_memory()
+SESSION_MEMORY_LIMIT = int(float(os.environ.get("SESSION_MEMORY_LIMIT_MB", "16")) * 2 ** 20)
+
+
+class Message:
+    # One chat message. Far smaller than the {"role": ..., "content": ...}
+    # dicts it replaces, and immutable, so histories, snapshots and background
+    # work can share messages instead of copying them. Supports msg['role']
+    # and msg['content'] like the dicts did.
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        # Roles come from a handful of values; interning makes every
+        # message share one string per role
+        object.__setattr__(self, "role", sys.intern(role))
+        object.__setattr__(self, "content", content)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Message is immutable")
+
+    def __reduce__(self):
+        # pickle and copy would otherwise restore the slots through
+        # __setattr__
+        return (Message, (self.role, self.content))
+
+    def __getitem__(self, key):
+        if key in Message.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in Message.__slots__ else default
+
+    def keys(self):
+        return Message.__slots__
+
+    def __eq__(self, other):
+        try:
+            return self.role == other['role'] and self.content == other['content']
+        except (KeyError, TypeError):
+            return NotImplemented
+
+    def __hash__(self):
+        return hash((self.role, self.content))
+
+    def __repr__(self):
+        return f"Message(role={self.role!r}, content={self.content!r})"
+
+    def memory_bytes(self):
+        # The role is interned and shared, so it isn't counted
+        return sys.getsizeof(self) + sys.getsizeof(self.content)
+
+
+def to_message(message):
+    if isinstance(message, Message):
+        return message
+    return Message(message['role'], message['content'])
+
+
+def _bytes_of(messages):
+    return sum(message.memory_bytes() for message in messages)
+
+
+class ChatHistory(list):
+    # A session's chat_history: a list of Messages that turns dicts added to
+    # it into Messages and keeps a running total of the memory they hold.
+    # Every mutating list method is overridden so nothing gets in unconverted
+    # or uncounted.
+    def __init__(self, messages=()):
+        super().__init__(to_message(message) for message in messages)
+        self._bytes = _bytes_of(self)
+
+    def __reduce__(self):
+        return (ChatHistory, (list(self),))
+
+    def append(self, message):
+        message = to_message(message)
+        super().append(message)
+        self._bytes += message.memory_bytes()
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._bytes = _bytes_of(self)
+        return self
+
+    def insert(self, index, message):
+        message = to_message(message)
+        super().insert(index, message)
+        self._bytes += message.memory_bytes()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            removed = self[index]
+            value = [to_message(message) for message in value]
+            super().__setitem__(index, value)
+            self._bytes += _bytes_of(value) - _bytes_of(removed)
+        else:
+            removed = self[index]
+            value = to_message(value)
+            super().__setitem__(index, value)
+            self._bytes += value.memory_bytes() - removed.memory_bytes()
+
+    def __delitem__(self, index):
+        removed = self[index]
+        super().__delitem__(index)
+        self._bytes -= _bytes_of(removed) if isinstance(index, slice) else removed.memory_bytes()
+
+    def pop(self, index=-1):
+        message = super().pop(index)
+        self._bytes -= message.memory_bytes()
+        return message
+
+    def remove(self, message):
+        del self[self.index(message)]
+
+    def clear(self):
+        super().clear()
+        self._bytes = 0
+
+    def memory_bytes(self):
+        return sys.getsizeof(self) + self._bytes
+
+
+def _approximate_bytes(value):
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_approximate_bytes(item) for item in value)
+    if isinstance(value, Message):
+        return value.memory_bytes()
+    if isinstance(value, dict) and isinstance(value.get('content'), str):
+        return sys.getsizeof(value) + sys.getsizeof(value['content'])
+    return sys.getsizeof(value)
+
+
+def session_memory(session_state):
+    # Approximate bytes held by each session_state entry. Objects that track
+    # their own footprint report it through memory_bytes(); anything else is
+    # counted shallowly, plus message text for plain message lists.
+    report = {}
+    for key, value in session_state.items():
+        measure = getattr(value, "memory_bytes", None)
+        report[key] = measure() if callable(measure) else _approximate_bytes(value)
+    return report
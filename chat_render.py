@@ -0,0 +1,66 @@
+# HTML for the chat messages drawn by the app variants
+import sys
+
+# Messages shown per page of chat history
+PAGE_SIZE = 20
+
+
+def assistant_bubble(content):
+    return f'<div class="message-container" style="display: flex; justify-content: flex-end;"><div class="assistant-message">{content}</div></div>'
+
+
+def user_bubble(content):
+    return f'<div class="message-container" style="display: flex; justify-content: flex-start;"><div class="user-message">{content}</div></div>'
+
+
+def message_html(message):
+    # Bubble style used by app.py and appVHLWORKING.py
+    if message['role'] == 'assistant':
+        return assistant_bubble(message['content'])
+    return user_bubble(message['content'])
+
+
+def message_card_html(message):
+    # Card style used by appsliders.py
+    if message['role'] == 'assistant':
+        return f'<div class="chat-message assistant-message">🐙 {message["content"]}</div>'
+    return f'<div class="chat-message user-message"><b>You:</b> {message["content"]}</div>'
+
+
+class ChatRenderer:
+    # Renders each message's HTML once and only emits the most recent pages of
+    # the conversation, so a rerun costs the same however long the chat gets.
+    # Keep one per session; older pages are revealed with show_more().
+    def __init__(self, to_html=message_html, page_size=PAGE_SIZE):
+        self.to_html = to_html
+        self.page_size = page_size
+        self.pages = 1
+        self._html = []
+        self._bytes = 0
+        self._source = None
+
+    def sync(self, messages):
+        # Render only messages appended since the last sync. A different or
+        # shorter list (reset, load_chat) starts over from the first page.
+        if messages is not self._source or len(messages) < len(self._html):
+            self._html = []
+            self._bytes = 0
+            self._source = messages
+            self.pages = 1
+        for message in messages[len(self._html):]:
+            html = self.to_html(message)
+            self._html.append(html)
+            self._bytes += sys.getsizeof(html)
+        return self
+
+    def hidden_count(self):
+        return max(0, len(self._html) - self.pages * self.page_size)
+
+    def show_more(self):
+        self.pages += 1
+
+    def window_html(self):
+        return "".join(self._html[self.hidden_count():])
+
+    def memory_bytes(self):
+        return sys.getsizeof(self._html) + self._bytes
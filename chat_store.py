@@ -0,0 +1,260 @@
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from chat_history import Message, to_message
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    parent_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS saves (
+    save_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    message_count INTEGER NOT NULL,
+    owner_id TEXT
+);
+CREATE INDEX IF NOT EXISTS saves_by_conversation ON saves (conversation_id, timestamp);
+CREATE INDEX IF NOT EXISTS saves_by_timestamp ON saves (timestamp);
+"""
+
+# Applied after SCHEMA; databases created before saves had an owner get
+# the column first, and their old saves stay unowned (listed to no session)
+OWNER_INDEX = "CREATE INDEX IF NOT EXISTS saves_by_owner ON saves (owner_id, timestamp)"
+
+
+class Snapshot:
+    # Chat history as of one save: the snapshot it extends plus the messages
+    # added since. Consecutive saves share their common prefix, and Messages
+    # are immutable, so a snapshot is unaffected by whatever the session
+    # does to its history afterwards.
+    __slots__ = ("parent", "messages", "length", "depth")
+
+    # Chains deeper than this are flattened on the next save, bounding the
+    # walk in restore()
+    MAX_DEPTH = 64
+
+    def __init__(self, parent, messages):
+        if parent is not None and parent.depth >= Snapshot.MAX_DEPTH:
+            messages = parent.restore() + list(messages)
+            parent = None
+        self.parent = parent
+        self.messages = tuple(messages)
+        self.length = (parent.length if parent is not None else 0) + len(self.messages)
+        self.depth = parent.depth + 1 if parent is not None else 1
+
+    def restore(self, count=None):
+        # The first count messages (all by default) as a new list
+        count = self.length if count is None else count
+        segments = []
+        node = self
+        while node is not None:
+            segments.append(node.messages)
+            node = node.parent
+        messages = []
+        for segment in reversed(segments):
+            messages.extend(segment)
+        del messages[count:]
+        return messages
+
+
+class ChatStore:
+    # Persistent chat history. A conversation's messages are only ever
+    # appended, so a save writes just the messages added since the last one
+    # plus a small row recording how many messages it covers. Loading a save
+    # forks a new conversation that points back at its parent instead of
+    # copying the shared prefix.
+    #
+    # Recent saves are also kept in memory as Snapshots, so loading one
+    # doesn't go back to the database and many saves of a conversation cost
+    # little more than the messages they add.
+    def __init__(self, path, max_snapshots=1024):
+        self.path = path
+        self.max_snapshots = max_snapshots
+        self._local = threading.local()
+        self._snapshots = OrderedDict()  # save_id -> (conversation_id, Snapshot)
+        self._latest = OrderedDict()  # conversation_id -> Snapshot of its last save or load
+        self._snapshot_lock = threading.Lock()
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(saves)")]
+        if "owner_id" not in columns:
+            connection.execute("ALTER TABLE saves ADD COLUMN owner_id TEXT")
+        connection.execute(OWNER_INDEX)
+        connection.commit()
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, and Streamlit
+        # runs each session's script on its own thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def new_conversation(self, parent_id=None, parent_count=0):
+        conversation_id = uuid.uuid4().hex
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO conversations (conversation_id, parent_id, parent_count, created_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, parent_id, parent_count, time.time())
+            )
+        return conversation_id
+
+    def _parent(self, conversation_id):
+        row = self._connection().execute(
+            "SELECT parent_id, parent_count FROM conversations WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()
+        return row or (None, 0)
+
+    def message_count(self, conversation_id):
+        # Messages in the conversation, counting the prefix shared with its parent
+        _, parent_count = self._parent(conversation_id)
+        row = self._connection().execute(
+            "SELECT MAX(seq) FROM messages WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()
+        return parent_count if row[0] is None else row[0] + 1
+
+    def append_messages(self, conversation_id, messages):
+        # Write the messages that aren't stored yet; returns how many were new
+        start = self.message_count(conversation_id)
+        new_messages = messages[start:]
+        if new_messages:
+            now = time.time()
+            with self._connection() as connection:
+                connection.executemany(
+                    "INSERT INTO messages (conversation_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(conversation_id, start + i, msg['role'], msg['content'], now) for i, msg in enumerate(new_messages)]
+                )
+        return len(new_messages)
+
+    def save(self, conversation_id, messages, timestamp=None, owner_id=None):
+        # owner_id is the session the save belongs to; only that session can
+        # list or load it
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.append_messages(conversation_id, messages)
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "INSERT INTO saves (conversation_id, timestamp, message_count, owner_id) VALUES (?, ?, ?, ?)",
+                (conversation_id, timestamp, len(messages), owner_id)
+            )
+        self._remember(cursor.lastrowid, conversation_id, messages)
+        return cursor.lastrowid
+
+    def _remember(self, save_id, conversation_id, messages):
+        with self._snapshot_lock:
+            previous = self._latest.get(conversation_id)
+            if previous is not None and previous.length == len(messages):
+                # Nothing new since, e.g. Summarize right after a save
+                snapshot = previous
+            elif previous is not None and previous.length < len(messages):
+                snapshot = Snapshot(previous, [to_message(msg) for msg in messages[previous.length:]])
+            else:
+                snapshot = Snapshot(None, [to_message(msg) for msg in messages])
+            self._cache(self._latest, conversation_id, snapshot)
+            self._cache(self._snapshots, save_id, (conversation_id, snapshot))
+        return snapshot
+
+    def _cache(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_snapshots:
+            cache.popitem(last=False)
+
+    def snapshot_stats(self):
+        with self._snapshot_lock:
+            return {"saves": len(self._snapshots), "conversations": len(self._latest)}
+
+    def list_saves(self, conversation_id=None, owner_id=None, limit=20, offset=0):
+        # Newest first, one page at a time. The apps always pass owner_id;
+        # leaving it out lists every session's saves, for offline tools.
+        query = "SELECT save_id, conversation_id, timestamp, message_count FROM saves"
+        conditions = []
+        params = []
+        if owner_id is not None:
+            conditions.append("owner_id = ?")
+            params.append(owner_id)
+        if conversation_id is not None:
+            conditions.append("conversation_id = ?")
+            params.append(conversation_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp DESC, save_id DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        rows = self._connection().execute(query, params).fetchall()
+        return [
+            {"save_id": save_id, "conversation_id": conversation_id, "timestamp": timestamp, "message_count": message_count}
+            for save_id, conversation_id, timestamp, message_count in rows
+        ]
+
+    def get_save(self, save_id):
+        row = self._connection().execute(
+            "SELECT conversation_id, timestamp, message_count, owner_id FROM saves WHERE save_id = ?",
+            (save_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        conversation_id, timestamp, message_count, owner_id = row
+        return {"save_id": save_id, "conversation_id": conversation_id, "timestamp": timestamp,
+                "message_count": message_count, "owner_id": owner_id}
+
+    def load_messages(self, conversation_id, count=None):
+        # Follow parent links for the shared prefix, then read this
+        # conversation's own messages
+        parent_id, parent_count = self._parent(conversation_id)
+        if count is None:
+            count = self.message_count(conversation_id)
+        messages = []
+        if parent_id is not None:
+            messages = self.load_messages(parent_id, min(count, parent_count))
+        rows = self._connection().execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (conversation_id, len(messages), count)
+        ).fetchall()
+        messages.extend(Message(role, content) for role, content in rows)
+        return messages
+
+    def load_save(self, save_id, owner_id=None):
+        # Returns (messages, conversation_id) where the conversation is a new
+        # fork of the saved one, ready to continue appending to, or
+        # (None, None) when there's no such save or owner_id doesn't own it.
+        # Ownership is checked against the database even when the messages
+        # come from a snapshot.
+        save = self.get_save(save_id)
+        if save is None or (owner_id is not None and save["owner_id"] != owner_id):
+            return None, None
+        with self._snapshot_lock:
+            cached = self._snapshots.get(save_id)
+            if cached is not None:
+                self._snapshots.move_to_end(save_id)
+        if cached is not None:
+            conversation_id, snapshot = cached
+            messages = snapshot.restore()
+        else:
+            conversation_id = save["conversation_id"]
+            messages = self.load_messages(conversation_id, save["message_count"])
+            snapshot = self._remember(save_id, conversation_id, messages)
+        fork = self.new_conversation(conversation_id, snapshot.length)
+        # The fork's first save extends the loaded snapshot
+        with self._snapshot_lock:
+            self._cache(self._latest, fork, snapshot)
+        return messages, fork
@@ -0,0 +1,176 @@
+import json
+import re
+import threading
+import time
+import weakref
+
+import httpx
+
+from metrics import counter, histogram
+
+CONNECT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+RUN_CREATE_PATH = re.compile(r"/threads/(runs|[^/]+/runs)$")
+RUN_PATH = re.compile(r"/threads/[^/]+/runs/[^/]+$")
+
+_transports = weakref.WeakSet()
+
+
+class PooledTransport(httpx.HTTPTransport):
+    # httpx transport that records what the connection pool is doing: how
+    # many requests go through it, how many of them had to open a new
+    # connection (TCP connect and TLS handshake) and how long that took.
+    # Connection setup showing up per turn means the pool is too small or
+    # keep-alives expire too soon.
+    #
+    # With a scheduler, every request also waits for admission there, 429s
+    # pause all requests, and run usage seen in responses (polled runs and
+    # streamed run events) settles the scheduler's token estimate.
+    def __init__(self, limits, scheduler=None, **kwargs):
+        super().__init__(limits=limits, **kwargs)
+        self.limits = limits
+        self.scheduler = scheduler
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.requests = counter("http_requests")
+        self.connects = counter("http_connections_opened")
+        self.handshakes = counter("http_tls_handshakes")
+        _transports.add(self)
+
+    def _trace(self, chained):
+        started = {}
+
+        def trace(event, info):
+            name, _, phase = event.rpartition('.')
+            if phase == 'started':
+                started[name] = time.perf_counter()
+            elif phase == 'complete' and name in started:
+                elapsed = time.perf_counter() - started.pop(name)
+                if name == 'connection.connect_tcp':
+                    self.connects.inc()
+                    histogram("http_connect_seconds", CONNECT_BUCKETS).observe(elapsed)
+                elif name == 'connection.start_tls':
+                    self.handshakes.inc()
+                    histogram("http_tls_seconds", CONNECT_BUCKETS).observe(elapsed)
+            if chained is not None:
+                chained(event, info)
+        return trace
+
+    def handle_request(self, request):
+        scheduler = self.scheduler
+        if scheduler is not None:
+            if request.method == "POST" and RUN_CREATE_PATH.search(request.url.path):
+                scheduler.acquire_run()
+            else:
+                scheduler.acquire()
+
+        request.extensions = dict(request.extensions, trace=self._trace(request.extensions.get("trace")))
+        self.requests.inc()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            response = super().handle_request(request)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        if scheduler is not None:
+            if response.status_code == 429:
+                scheduler.rate_limited_response(_retry_after(response))
+            else:
+                scheduler.succeeded()
+            self._observe_usage(request, response)
+        return response
+
+    def _observe_usage(self, request, response):
+        content_type = response.headers.get("content-type", "")
+        if content_type.startswith("text/event-stream"):
+            response.stream = UsageEventStream(response.stream, self.scheduler)
+        elif response.status_code == 200 and request.method == "GET" and RUN_PATH.search(request.url.path):
+            response.read()
+            try:
+                run = json.loads(response.content)
+            except ValueError:
+                return
+            if run.get("usage"):
+                self.scheduler.observe_run_usage(run["usage"]["total_tokens"])
+
+    def stats(self):
+        connections = list(self._pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            "connections": len(connections),
+            "idle": idle,
+            "active": len(connections) - idle,
+            "in_flight": self.in_flight,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+        }
+
+
+class UsageEventStream(httpx.SyncByteStream):
+    # Passes a server-sent event stream through untouched while picking the
+    # usage out of the run's final event
+    def __init__(self, stream, scheduler):
+        self.stream = stream
+        self.scheduler = scheduler
+
+    def __iter__(self):
+        buffer = b""
+        event = None
+        for chunk in self.stream:
+            yield chunk
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.startswith(b"event:"):
+                    event = line[6:].strip()
+                elif line.startswith(b"data:") and event in (b"thread.run.completed", b"thread.run.failed", b"thread.run.incomplete"):
+                    try:
+                        usage = json.loads(line[5:]).get("usage")
+                    except ValueError:
+                        continue
+                    if usage:
+                        self.scheduler.observe_run_usage(usage["total_tokens"])
+
+    def close(self):
+        self.stream.close()
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+def pooled_http_client(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60,
+                       connect_timeout=5, read_timeout=60, write_timeout=30, pool_timeout=10, scheduler=None):
+    # One of these backs the process-wide OpenAI client, so every session
+    # reuses warm connections instead of reconnecting per rerun.
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry
+    )
+    return httpx.Client(
+        transport=PooledTransport(limits=limits, scheduler=scheduler),
+        timeout=httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout),
+        follow_redirects=True
+    )
+
+
+def pool_stats():
+    # Connection pool usage plus request and connection counts, summed over
+    # every pooled client in the process
+    totals = {"connections": 0, "idle": 0, "active": 0, "in_flight": 0}
+    for transport in list(_transports):
+        for key, value in transport.stats().items():
+            if key in totals:
+                totals[key] += value
+    totals.update(
+        requests=counter("http_requests").value,
+        connections_opened=counter("http_connections_opened").value,
+        tls_handshakes=counter("http_tls_handshakes").value,
+    )
+    return totals
@@ -0,0 +1,278 @@
+import bisect
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) for latency histograms
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120)
+# Upper bounds for timing spans, from sub-millisecond local work up to runs
+SPAN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Upper bounds for per-run token counts
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+
+class Histogram:
+    # Fixed-bucket histogram, safe to share between Streamlit sessions
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, q):
+        # Upper bound of the bucket holding the q-th percentile
+        with self._lock:
+            if not self.count:
+                return None
+            target = q / 100 * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+                seen += count
+                if seen >= target:
+                    return bound
+        return float('inf')
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "buckets": dict(zip(self.buckets + (float('inf'),), self.counts)),
+            }
+
+
+class Counter:
+    # Monotonic count, safe to share between Streamlit sessions
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    # Value that goes up and down, such as a queue depth
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+_histograms = {}
+_counters = {}
+_gauges = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name, buckets=DEFAULT_BUCKETS):
+    # Process-wide histogram registry
+    with _registry_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, buckets)
+        return _histograms[name]
+
+
+def histograms():
+    with _registry_lock:
+        return dict(_histograms)
+
+
+def counter(name):
+    # Process-wide counter registry
+    with _registry_lock:
+        if name not in _counters:
+            _counters[name] = Counter(name)
+        return _counters[name]
+
+
+def counters():
+    with _registry_lock:
+        return dict(_counters)
+
+
+def gauge(name):
+    # Process-wide gauge registry
+    with _registry_lock:
+        if name not in _gauges:
+            _gauges[name] = Gauge(name)
+        return _gauges[name]
+
+
+def gauges():
+    with _registry_lock:
+        return dict(_gauges)
+
+
+class TokenUsage:
+    # Running token totals per action ("chat", "summarize", ...) from the
+    # usage block of completed runs. One per session; the process-wide
+    # histograms see every run too. Background runs add to it from worker
+    # threads.
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, action, usage):
+        if usage is None:
+            return
+        if not isinstance(usage, dict):
+            usage = usage.model_dump()
+        with self._lock:
+            totals = self.totals.setdefault(action, {"runs": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+            totals["runs"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                totals[key] += usage.get(key) or 0
+        histogram(f"run_prompt_tokens_{action}", buckets=TOKEN_BUCKETS).observe(usage.get("prompt_tokens") or 0)
+
+    def total(self, key="total_tokens"):
+        with self._lock:
+            return sum(totals[key] for totals in self.totals.values())
+
+    def report(self):
+        with self._lock:
+            return {action: dict(totals) for action, totals in self.totals.items()}
+
+
+class SpanRecorder:
+    # One session's timing spans: everything recorded during the latest two
+    # reruns, and running totals per span name across the session
+    def __init__(self):
+        self.last_run = []
+        self.previous_run = []
+        self.totals = {}
+        self.runs = 0
+
+    def start_run(self):
+        # Most reruns end by triggering another, so the previous run is
+        # usually the interesting one
+        self.previous_run = self.last_run
+        self.last_run = []
+        self.runs += 1
+
+    def add(self, name, seconds):
+        self.last_run.append((name, seconds))
+        totals = self.totals.setdefault(name, {"count": 0, "seconds": 0.0, "max": 0.0})
+        totals["count"] += 1
+        totals["seconds"] += seconds
+        totals["max"] = max(totals["max"], seconds)
+
+    def report(self):
+        return {
+            name: {"count": totals["count"], "total_ms": round(totals["seconds"] * 1000, 1),
+                   "mean_ms": round(totals["seconds"] * 1000 / totals["count"], 1),
+                   "max_ms": round(totals["max"] * 1000, 1)}
+            for name, totals in sorted(self.totals.items(), key=lambda item: -item[1]["seconds"])
+        }
+
+
+_recorder = contextvars.ContextVar("span_recorder", default=None)
+
+
+@contextmanager
+def recording(recorder):
+    # Spans inside the block are also added to recorder; wrap each rerun
+    recorder.start_run()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def span(name):
+    # Time the block into the process-wide span_<name>_seconds histogram and
+    # the session recorder, if there is one
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram(f"span_{name}_seconds", SPAN_BUCKETS).observe(elapsed)
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.add(name, elapsed)
+
+
+def _metric_name(name, prefix):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', f"{prefix}{name}")
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(prefix="coachbot_"):
+    # Every registered metric in the Prometheus text exposition format
+    lines = []
+    for name, metric in sorted(histograms().items()):
+        name = _metric_name(name, prefix)
+        snapshot = metric.snapshot()
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in snapshot["buckets"].items():
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{name}_sum {_format_value(snapshot['sum'])}")
+        lines.append(f"{name}_count {snapshot['count']}")
+    for name, metric in sorted(counters().items()):
+        name = _metric_name(name, prefix)
+        lines.append(f"# TYPE {name}_total counter")
+        lines.append(f"{name}_total {metric.value}")
+    for name, metric in sorted(gauges().items()):
+        name = _metric_name(name, prefix)
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format_value(metric.value)}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port, host="0.0.0.0"):
+    # Serve prometheus_text() at /metrics on a background thread
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,406 @@
+# Local stand-in for the parts of the OpenAI Assistants API the apps use:
+# threads, messages and runs, including streamed runs. Lets the apps, the
+# benchmarks and load tests run without credentials or cost.
+#
+#   python mock_assistants_server.py --port 8008 --queue-latency lognormal:0.8,0.4 \
+#       --token-latency const:0.02 --failure-rate 0.05
+#
+# Point an app at it with OPENAI_BASE_URL=http://127.0.0.1:8008/v1 (any
+# OPENAI_API_KEY value works).
+#
+# Latencies are given as const:x, uniform:low,high, normal:mean,sd or
+# lognormal:median,sigma, in seconds.
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+REPLIES = [
+    "It sounds like this change really matters to you. What would be different if you made it?",
+    "You've already thought about this a lot. What's one small step you could take this week?",
+    "On a scale from 0 to 10, how important is this change to you right now?",
+    "What has helped you make changes in the past, and how could that help here?",
+    "That's a real mix of feelings. What makes you want to change, and what holds you back?",
+]
+
+
+def parse_distribution(spec):
+    # Returns a zero-argument sampler for a latency spec like "uniform:0.5,2"
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',')] if params else []
+    if kind == 'const':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def count_tokens(text):
+    # Rough token estimate, good enough for usage reports
+    return max(1, len(text) // 4)
+
+
+class MockState:
+    def __init__(self, queue_latency, token_latency, request_latency, failure_rate, error_rate, reply_words):
+        self.queue_latency = queue_latency
+        self.token_latency = token_latency
+        self.request_latency = request_latency
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.reply_words = reply_words
+        self.threads = {}
+        self.runs = {}
+        self.lock = threading.Lock()
+
+    def new_id(self, prefix):
+        return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+    def create_thread(self, body):
+        thread_id = self.new_id("thread")
+        with self.lock:
+            self.threads[thread_id] = []
+        for message in body.get("messages") or []:
+            self.add_message(thread_id, message.get("role", "user"), message["content"])
+        return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}, "tool_resources": None}
+
+    def delete_thread(self, thread_id):
+        with self.lock:
+            del self.threads[thread_id]
+        return {"id": thread_id, "object": "thread.deleted", "deleted": True}
+
+    def add_message(self, thread_id, role, content, assistant_id=None, run_id=None):
+        message = {
+            "id": self.new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+            "assistant_id": assistant_id,
+            "run_id": run_id,
+            "attachments": [],
+            "metadata": {},
+            "status": "completed",
+            "incomplete_details": None,
+            "completed_at": int(time.time()),
+            "incomplete_at": None,
+        }
+        with self.lock:
+            self.threads[thread_id].append(message)
+        return message
+
+    def create_run(self, thread_id, body):
+        with self.lock:
+            history = list(self.threads[thread_id])
+        prompt = " ".join(m["content"][0]["text"]["value"] for m in history)
+        prompt += body.get("additional_instructions") or ""
+        words = random.choice(REPLIES).split()
+        reply_words = [words[i % len(words)] for i in range(max(self.reply_words, 1))] if self.reply_words else words
+        tokens = [word if i == 0 else " " + word for i, word in enumerate(reply_words)]
+        now = time.time()
+        queued_for = self.queue_latency()
+        run = {
+            "id": self.new_id("run"),
+            "object": "thread.run",
+            "created_at": int(now),
+            "thread_id": thread_id,
+            "assistant_id": body["assistant_id"],
+            "status": "queued",
+            "instructions": body.get("instructions") or "",
+            "model": body.get("model") or "mock-assistant",
+            "tools": [],
+            "metadata": {},
+            "parallel_tool_calls": False,
+            "required_action": None,
+            "last_error": None,
+            "incomplete_details": None,
+            "started_at": None,
+            "completed_at": None,
+            "cancelled_at": None,
+            "failed_at": None,
+            "expires_at": int(now) + 600,
+            "usage": None,
+            "temperature": None,
+            "top_p": None,
+            "truncation_strategy": {"type": "auto", "last_messages": None},
+            "tool_choice": "auto",
+            "response_format": "auto",
+            "max_prompt_tokens": None,
+            "max_completion_tokens": None,
+        }
+        with self.lock:
+            self.runs[run["id"]] = {
+                "run": run,
+                "tokens": tokens,
+                "starts_at": now + queued_for,
+                "finishes_at": now + queued_for + sum(self.token_latency() for _ in tokens),
+                "fails": random.random() < self.failure_rate,
+                "prompt_tokens": count_tokens(prompt),
+            }
+        return run
+
+    def finish(self, state, status):
+        run = state["run"]
+        run["status"] = status
+        now = int(time.time())
+        if status == "completed":
+            reply = "".join(state["tokens"])
+            message = self.add_message(run["thread_id"], "assistant", reply, run["assistant_id"], run["id"])
+            state["message_id"] = message["id"]
+            run["completed_at"] = now
+            completion_tokens = count_tokens(reply)
+            run["usage"] = {
+                "prompt_tokens": state["prompt_tokens"],
+                "completion_tokens": completion_tokens,
+                "total_tokens": state["prompt_tokens"] + completion_tokens,
+            }
+        elif status == "failed":
+            run["failed_at"] = now
+            run["last_error"] = {"code": "server_error", "message": "Simulated run failure"}
+        elif status == "cancelled":
+            run["cancelled_at"] = now
+
+    def advance(self, run_id):
+        # Move a polled run along its timeline
+        with self.lock:
+            state = self.runs[run_id]
+        run = state["run"]
+        if run["status"] in ("completed", "failed", "cancelled"):
+            return run
+        now = time.time()
+        if now >= state["finishes_at"]:
+            self.finish(state, "failed" if state["fails"] else "completed")
+        elif now >= state["starts_at"]:
+            run["status"] = "in_progress"
+            run["started_at"] = run["started_at"] or int(state["starts_at"])
+        return run
+
+    def cancel(self, run_id):
+        with self.lock:
+            state = self.runs[run_id]
+        if state["run"]["status"] in ("queued", "in_progress"):
+            self.finish(state, "cancelled")
+        return state["run"]
+
+    def list_messages(self, thread_id, query):
+        with self.lock:
+            messages = list(self.threads[thread_id])
+        if query.get("run_id"):
+            messages = [m for m in messages if m["run_id"] == query["run_id"][0]]
+        if query.get("order", ["desc"])[0] == "desc":
+            messages.reverse()
+        limit = int(query.get("limit", ["20"])[0])
+        page = messages[:limit]
+        return {
+            "object": "list",
+            "data": page,
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(messages) > limit,
+        }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, event, data):
+        payload = data if isinstance(data, str) else json.dumps(data)
+        chunk = f"event: {event}\ndata: {payload}\n\n".encode()
+        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def _maybe_fail(self):
+        # Simulated transport-level errors: rate limits and server errors
+        state = self.state
+        time.sleep(state.request_latency())
+        if random.random() < state.error_rate:
+            status = random.choice((429, 500, 503))
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self._send_json({"error": {"message": "Simulated error", "type": "server_error", "code": None}}, status, headers)
+            return True
+        return False
+
+    def _route(self, method):
+        path = urlparse(self.path)
+        query = parse_qs(path.query)
+        route = re.sub(r"^/v1", "", path.path).rstrip("/")
+        state = self.state
+        # Read the body up front so an early error response leaves the
+        # keep-alive connection clean
+        body = self._body() if method == "POST" else {}
+
+        if self._maybe_fail():
+            return
+        try:
+            if method == "POST" and route == "/threads":
+                return self._send_json(state.create_thread(body))
+
+            match = re.fullmatch(r"/threads/([^/]+)", route)
+            if match and method == "DELETE":
+                return self._send_json(state.delete_thread(match[1]))
+
+            match = re.fullmatch(r"/threads/([^/]+)/messages", route)
+            if match and method == "POST":
+                return self._send_json(state.add_message(match[1], body.get("role", "user"), body["content"]))
+            if match and method == "GET":
+                return self._send_json(state.list_messages(match[1], query))
+
+            match = re.fullmatch(r"/threads/([^/]+)/runs", route)
+            if match and method == "POST":
+                run = state.create_run(match[1], body)
+                if body.get("stream"):
+                    return self._stream_run(run)
+                return self._send_json(run)
+
+            match = re.fullmatch(r"/threads/([^/]+)/runs/([^/]+)", route)
+            if match and method == "GET":
+                return self._send_json(state.advance(match[2]))
+
+            match = re.fullmatch(r"/threads/([^/]+)/runs/([^/]+)/cancel", route)
+            if match and method == "POST":
+                return self._send_json(state.cancel(match[2]))
+        except KeyError:
+            return self._send_json({"error": {"message": "Not found", "type": "invalid_request_error", "code": None}}, 404)
+
+        self._send_json({"error": {"message": f"Unsupported route {method} {route}", "type": "invalid_request_error", "code": None}}, 404)
+
+    def _stream_run(self, run):
+        state = self.state
+        with state.lock:
+            run_state = state.runs[run["id"]]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        self._send_event("thread.run.created", run)
+        self._send_event("thread.run.queued", run)
+        time.sleep(max(0.0, run_state["starts_at"] - time.time()))
+        run["status"] = "in_progress"
+        run["started_at"] = int(time.time())
+        self._send_event("thread.run.in_progress", run)
+
+        if run_state["fails"]:
+            state.finish(run_state, "failed")
+            self._send_event("thread.run.failed", run)
+        else:
+            message_id = state.new_id("msg")
+            message = {
+                "id": message_id, "object": "thread.message", "created_at": int(time.time()),
+                "thread_id": run["thread_id"], "role": "assistant", "content": [],
+                "assistant_id": run["assistant_id"], "run_id": run["id"], "attachments": [],
+                "metadata": {}, "status": "in_progress", "incomplete_details": None,
+                "completed_at": None, "incomplete_at": None,
+            }
+            self._send_event("thread.message.created", message)
+            per_token = (run_state["finishes_at"] - run_state["starts_at"]) / max(len(run_state["tokens"]), 1)
+            for token in run_state["tokens"]:
+                time.sleep(per_token)
+                if run["status"] == "cancelled":
+                    break
+                self._send_event("thread.message.delta", {
+                    "id": message_id,
+                    "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token, "annotations": []}}]},
+                })
+            if run["status"] == "cancelled":
+                self._send_event("thread.run.cancelled", run)
+            else:
+                state.finish(run_state, "completed")
+                completed = state.threads[run["thread_id"]][-1]
+                self._send_event("thread.message.completed", completed)
+                self._send_event("thread.run.completed", run)
+
+        self._send_event("done", "[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+class MockServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections isn't worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(host="127.0.0.1", port=8008, queue_latency="const:0.5", token_latency="const:0.02",
+          request_latency="const:0", failure_rate=0.0, error_rate=0.0, reply_words=0):
+    # Starts the server on a background thread and returns it; call
+    # server.shutdown() to stop. Port 0 picks a free port.
+    state = MockState(
+        parse_distribution(queue_latency),
+        parse_distribution(token_latency),
+        parse_distribution(request_latency),
+        failure_rate,
+        error_rate,
+        reply_words,
+    )
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = MockServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Assistants API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--queue-latency", default="const:0.5", help="time a run spends queued")
+    parser.add_argument("--token-latency", default="const:0.02", help="time per generated token")
+    parser.add_argument("--request-latency", default="const:0", help="added to every HTTP request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of runs that fail")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/5xx")
+    parser.add_argument("--reply-words", type=int, default=0, help="fixed reply length in words (0 = canned replies)")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.queue_latency, args.token_latency, args.request_latency,
+                   args.failure_rate, args.error_rate, args.reply_words)
+    print(f"Mock Assistants API on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
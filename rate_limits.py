@@ -0,0 +1,172 @@
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import counter, gauge, histogram
+
+# Request priorities, most urgent first. Live chat turns go ahead of
+# Summarize and Review Readiness, which go ahead of background refreshes.
+CHAT = 0
+ANALYSIS = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {CHAT: "chat", ANALYSIS: "analysis", BACKGROUND: "background"}
+
+logger = logging.getLogger(__name__)
+
+_priority = contextvars.ContextVar("openai_request_priority", default=CHAT)
+
+
+@contextmanager
+def priority(level):
+    # OpenAI calls made inside the block queue at this priority. Worker
+    # threads don't inherit it, so code submitted to an executor sets its own.
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class TokenBucket:
+    # Refills at rate per second up to capacity. Not thread-safe on its own;
+    # the scheduler holds its lock around every call.
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.clock = clock
+        self._updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        # Seconds until amount is available (amount is capped at capacity so
+        # an oversized request can still go through once the bucket is full)
+        missing = min(amount, self.capacity) - self.level
+        return 0 if missing <= 0 else missing / self.rate
+
+    def take(self, amount):
+        # May go negative when usage turns out higher than estimated
+        self.level -= amount
+
+
+class RequestScheduler:
+    # Process-wide admission control for OpenAI requests: a token bucket for
+    # requests per minute and one for tokens per minute, a priority queue so
+    # chat turns are let through first, and a shared pause after a 429 so
+    # every session backs off together instead of each retrying on its own.
+    #
+    # Run token usage isn't known until the run finishes, so creating a run
+    # is charged an estimate (a moving average of recent runs) and the
+    # difference is settled when the usage is observed.
+    def __init__(self, requests_per_minute=500, tokens_per_minute=150000, burst_seconds=10,
+                 initial_run_tokens=1000, max_backoff=60, clock=time.monotonic):
+        self.clock = clock
+        self.requests = self._bucket(requests_per_minute, burst_seconds)
+        self.tokens = self._bucket(tokens_per_minute, burst_seconds)
+        self.run_tokens_estimate = initial_run_tokens
+        self.max_backoff = max_backoff
+        self.paused_until = 0
+        self._backoff = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.depth = {level: gauge(f"scheduler_queue_depth_{name}") for level, name in PRIORITY_NAMES.items()}
+        self.rate_limited = counter("scheduler_rate_limited")
+
+    def _bucket(self, per_minute, burst_seconds):
+        if not per_minute:
+            return None
+        rate = per_minute / 60
+        return TokenBucket(rate, max(1, rate * burst_seconds), self.clock)
+
+    def _wait_time(self, tokens):
+        wait = max(0, self.paused_until - self.clock())
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None and amount:
+                bucket.refill()
+                wait = max(wait, bucket.wait_time(amount))
+        return wait
+
+    def acquire(self, tokens=0, level=None):
+        # Block until the request may be sent; returns the seconds waited
+        level = current_priority() if level is None else level
+        started = self.clock()
+        ticket = (level, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+            self.depth[level].inc()
+            try:
+                while True:
+                    wait = self._wait_time(tokens)
+                    if self._queue[0] == ticket and wait <= 0:
+                        break
+                    # Woken early when the queue head changes or a 429 clears
+                    self._condition.wait(wait if self._queue[0] == ticket else None)
+                heapq.heappop(self._queue)
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(tokens)
+            except BaseException:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                raise
+            finally:
+                self.depth[level].dec()
+                self._condition.notify_all()
+
+        waited = self.clock() - started
+        histogram(f"scheduler_wait_seconds_{PRIORITY_NAMES.get(level, level)}").observe(waited)
+        return waited
+
+    def acquire_run(self, level=None):
+        # Admit the creation of a run, charged at the current estimate
+        return self.acquire(tokens=self.run_tokens_estimate, level=level)
+
+    def observe_run_usage(self, used):
+        # Settle the difference once a run's real usage is known and move the
+        # estimate towards it
+        with self._condition:
+            if self.tokens is not None:
+                self.tokens.take(used - self.run_tokens_estimate)
+            self.run_tokens_estimate = max(1, int(0.8 * self.run_tokens_estimate + 0.2 * used))
+
+    def rate_limited_response(self, retry_after=None):
+        # Pause every queued request after a 429, for Retry-After when the
+        # API sends one, otherwise with exponential backoff
+        with self._condition:
+            self._backoff = min(self.max_backoff, max(1, self._backoff * 2))
+            pause = retry_after if retry_after is not None else self._backoff
+            self.paused_until = max(self.paused_until, self.clock() + pause)
+            self._condition.notify_all()
+        self.rate_limited.inc()
+        logger.warning(f"Rate limited by the API, pausing requests for {pause:.1f}s")
+
+    def succeeded(self):
+        self._backoff = 0
+
+    def stats(self):
+        with self._condition:
+            depth = {PRIORITY_NAMES[level]: 0 for level in PRIORITY_NAMES}
+            for level, _ in self._queue:
+                depth[PRIORITY_NAMES.get(level, level)] += 1
+            return {
+                "queued": depth,
+                "paused_for": max(0, self.paused_until - self.clock()),
+                "requests_available": self.requests.level if self.requests is not None else None,
+                "tokens_available": self.tokens.level if self.tokens is not None else None,
+                "run_tokens_estimate": self.run_tokens_estimate,
+                "rate_limited": self.rate_limited.value,
+            }
@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import time
+
+# Process-wide resources shared by every Streamlit session. Modules imported by
+# the app scripts stay in sys.modules between reruns, so anything held here is
+# loaded once per server process instead of once per interaction.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHANGE_TALK_PATH = os.path.join(BASE_DIR, 'change_talk.json')
+CHAT_DB_PATH = os.environ.get("CHAT_DB_PATH", os.path.join(BASE_DIR, 'chat_history.db'))
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class CachedResource:
+    # Lazily loaded value with load timing. If watch names a file, the value
+    # is reloaded when that file's modification time changes.
+    def __init__(self, name, loader, watch=None):
+        self.name = name
+        self.loader = loader
+        self.watch = watch
+        self.load_seconds = None
+        self.loaded_at = None
+        self.loads = 0
+        self._value = None
+        self._loaded = False
+        self._version = None
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _current_version(self):
+        if self.watch is None:
+            return None
+        try:
+            return os.stat(self.watch).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self):
+        version = self._current_version()
+        if self._loaded and version == self._version:
+            return self._value
+        with self._lock:
+            if not self._loaded or version != self._version:
+                started = time.perf_counter()
+                self._value = self.loader()
+                self.load_seconds = time.perf_counter() - started
+                self.loaded_at = time.time()
+                self.loads += 1
+                self._version = version
+                self._loaded = True
+                logger.info(f"Loaded {self.name} in {self.load_seconds * 1000:.1f} ms")
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._loaded = False
+
+    def lazy(self):
+        return LazyResource(self)
+
+
+class LazyResource:
+    # Stands in for a resource's value and loads it on first attribute
+    # access, so module-level code can hold it without paying for the load
+    # (and the imports behind it) before it's needed
+    def __init__(self, resource):
+        self._resource = resource
+
+    def __getattr__(self, name):
+        return getattr(self._resource.get(), name)
+
+
+_preloading = set()
+
+
+def preload(*resources):
+    # Load resources on a background thread, once per process. Called after
+    # the first page is drawn, so it gets out quickly and the heavy imports
+    # are usually done by the time they're needed.
+    pending = [resource for resource in resources if resource.name not in _preloading]
+    if not pending:
+        return
+    _preloading.update(resource.name for resource in pending)
+
+    def load():
+        for resource in pending:
+            try:
+                resource.get()
+            except Exception as e:
+                logger.warning(f"Preloading {resource.name} failed: {e}")
+
+    thread = threading.Thread(target=load, name="preload", daemon=True)
+    try:
+        # Loaders read st.secrets, which warns on threads without the
+        # calling script's context
+        from streamlit.runtime.scriptrunner import add_script_run_ctx
+        add_script_run_ctx(thread)
+    except ImportError:
+        pass
+    thread.start()
+
+
+def invalidate(name=None):
+    # Drop one resource (or all of them); the next get() reloads it
+    for resource_name, resource in _registry.items():
+        if name is None or resource_name == name:
+            resource.invalidate()
+
+
+def load_report():
+    return {
+        name: {
+            "loaded": resource._loaded,
+            "loads": resource.loads,
+            "load_seconds": resource.load_seconds,
+            "loaded_at": resource.loaded_at,
+        }
+        for name, resource in _registry.items()
+    }
+
+
+def configure_logging():
+    # INFO by default; LOG_LEVEL=DEBUG brings back per-request HTTP logging
+    level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    logging.basicConfig(level=level)
+    if level != "DEBUG":
+        for name in ("httpx", "httpcore", "openai", "urllib3"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def _setting(name, default=None):
+    # Environment first, then Streamlit secrets
+    value = os.environ.get(name)
+    if value:
+        return value
+    import streamlit as st
+    if default is None:
+        return st.secrets[name]
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError:
+        # No secrets.toml at all, e.g. the key comes from the environment
+        return default
+
+
+def _load_openai_client():
+    from openai import OpenAI
+    from http_pool import pooled_http_client
+    # OPENAI_BASE_URL points the apps at another endpoint, such as
+    # mock_assistants_server.py for load tests
+    http_client = pooled_http_client(
+        max_connections=int(_setting("OPENAI_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(_setting("OPENAI_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(_setting("OPENAI_KEEPALIVE_EXPIRY", "60")),
+        connect_timeout=float(_setting("OPENAI_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(_setting("OPENAI_READ_TIMEOUT", "60")),
+        scheduler=scheduler.get()
+    )
+    return OpenAI(
+        api_key=_setting("OPENAI_API_KEY"),
+        base_url=_setting("OPENAI_BASE_URL", "") or None,
+        http_client=http_client
+    )
+
+
+def _load_scheduler():
+    from rate_limits import RequestScheduler
+    # Match these to the organisation's OpenAI rate limits; 0 disables a limit
+    return RequestScheduler(
+        requests_per_minute=float(_setting("OPENAI_REQUESTS_PER_MINUTE", "500")),
+        tokens_per_minute=float(_setting("OPENAI_TOKENS_PER_MINUTE", "150000"))
+    )
+
+
+def _load_sentiment_analyzer():
+    from sentiment import load_offline_analyzer
+    return load_offline_analyzer()
+
+
+def _load_change_talk_matcher():
+    from change_talk import ChangeTalkMatcher
+    return ChangeTalkMatcher.from_file(CHANGE_TALK_PATH)
+
+
+def _load_change_talk_classifier():
+    from change_talk import StatementClassifier
+    return StatementClassifier.from_file(CHANGE_TALK_PATH)
+
+
+def _load_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    # Assistant runs that carry on after the script run that started them
+    return ThreadPoolExecutor(
+        max_workers=int(os.environ.get("BACKGROUND_WORKERS", "8")),
+        thread_name_prefix="background-run"
+    )
+
+
+def _load_response_cache():
+    from response_cache import ResponseCache
+    return ResponseCache(
+        max_entries=int(os.environ.get("RESPONSE_CACHE_ENTRIES", "512")),
+        ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+    )
+
+
+def _load_pdf_export():
+    from chat_export import PdfExport
+    return PdfExport(executor.get())
+
+
+def _load_metrics_server():
+    # Prometheus scrape endpoint at :METRICS_PORT/metrics, off unless set
+    port = os.environ.get("METRICS_PORT")
+    if not port:
+        return None
+    from metrics import serve_prometheus
+    server = serve_prometheus(int(port))
+    logger.info(f"Serving metrics on port {server.server_address[1]}")
+    return server
+
+
+def _load_chat_store():
+    from chat_store import ChatStore
+    return ChatStore(CHAT_DB_PATH)
+
+
+scheduler = CachedResource("scheduler", _load_scheduler)
+openai_client = CachedResource("openai_client", _load_openai_client)
+sentiment_analyzer = CachedResource("sentiment_analyzer", _load_sentiment_analyzer)
+change_talk_matcher = CachedResource("change_talk_matcher", _load_change_talk_matcher, watch=CHANGE_TALK_PATH)
+change_talk_classifier = CachedResource("change_talk_classifier", _load_change_talk_classifier, watch=CHANGE_TALK_PATH)
+chat_store = CachedResource("chat_store", _load_chat_store)
+executor = CachedResource("executor", _load_executor)
+response_cache = CachedResource("response_cache", _load_response_cache)
+pdf_export = CachedResource("pdf_export", _load_pdf_export)
+metrics_server = CachedResource("metrics_server", _load_metrics_server)
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import counter
+
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class ResponseCache:
+    # Process-wide cache of assistant responses to analysis requests
+    # (Summarize, Review Readiness), keyed by assistant ID, instructions and a
+    # hash of the transcript. Least recently used entries are evicted beyond
+    # max_entries or max_bytes of response text, and entries expire after ttl
+    # seconds.
+    #
+    # Analysis responses end up in the chat themselves, so messages whose text
+    # is a cached response are left out of the transcript hash: asking again
+    # with nothing new said, or after loading the same saved chat, still hits.
+    def __init__(self, max_entries=512, max_bytes=8 * 2 ** 20, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (response, expires_at)
+        self._responses = {}  # digest of a cached response -> entries holding it
+        self._lock = threading.Lock()
+        self.hits = counter("response_cache_hits")
+        self.misses = counter("response_cache_misses")
+        self.evictions = counter("response_cache_evictions")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, assistant_id, messages, instructions=""):
+        with self._lock:
+            responses = set(self._responses)
+        transcript = [
+            _digest(msg['role'], msg['content'])
+            for msg in messages
+            if not (msg['role'] == 'assistant' and _digest(msg['content']) in responses)
+        ]
+        return _digest(assistant_id, instructions or "", *transcript)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= self.clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses.inc()
+                return None
+            self._entries.move_to_end(key)
+        self.hits.inc()
+        return entry[0]
+
+    def put(self, key, response):
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (response, self.clock() + self.ttl)
+            response_digest = _digest(response)
+            self._responses[response_digest] = self._responses.get(response_digest, 0) + 1
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions.inc()
+
+    def _remove(self, key):
+        response, _ = self._entries.pop(key)
+        self.bytes -= len(response.encode('utf-8'))
+        response_digest = _digest(response)
+        self._responses[response_digest] -= 1
+        if not self._responses[response_digest]:
+            del self._responses[response_digest]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._responses.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            entries, size = len(self._entries), self.bytes
+        lookups = self.hits.value + self.misses.value
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "evictions": self.evictions.value,
+            "hit_rate": self.hits.value / lookups if lookups else None,
+        }
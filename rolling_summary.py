@@ -0,0 +1,111 @@
+import logging
+import threading
+
+import rate_limits
+import run_waiter
+
+logger = logging.getLogger(__name__)
+
+
+def summary_prompt(previous_summary, messages):
+    chat_log = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    if not previous_summary:
+        return f"Please summarize the following chat log:\n{chat_log}"
+    return (
+        f"Here is a summary of a coaching conversation so far:\n{previous_summary}\n\n"
+        f"Update the summary so it also covers these newer messages:\n{chat_log}"
+    )
+
+
+class RollingSummary:
+    # Incremental conversation summary for one session. The checkpoint is the
+    # latest summary plus how many chat_history messages it covers; each
+    # update sends only that summary and the messages since, on a throwaway
+    # thread, so the cost of a summary stays flat as the chat grows.
+    # With refresh_every set, maybe_refresh() keeps the checkpoint current in
+    # the background every that many turns, so Summarize rarely has to wait.
+    def __init__(self, client, assistant_id, waiter=None, refresh_every=None, usage=None):
+        self.client = client
+        self.assistant_id = assistant_id
+        self.waiter = waiter
+        self.refresh_every = refresh_every
+        self.usage = usage
+        self.summary = None
+        self.covered = 0
+        self._future = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self.wait()
+        with self._lock:
+            self.summary = None
+            self.covered = 0
+
+    def pending(self):
+        return self._future is not None and not self._future.done()
+
+    def wait(self):
+        # Let a background refresh finish; its failure only means the next
+        # update covers more messages
+        future, self._future = self._future, None
+        if future is not None:
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f"Background summary refresh failed: {e}")
+
+    def _run(self, new_messages, covered, level=rate_limits.ANALYSIS):
+        prompt = summary_prompt(self.summary, new_messages)
+        with rate_limits.priority(level):
+            thread = self.client.beta.threads.create(messages=[{"role": "user", "content": prompt}])
+            try:
+                response, stats = run_waiter.run_assistant(self.client, thread.id, self.assistant_id, waiter=self.waiter)
+            finally:
+                try:
+                    self.client.beta.threads.delete(thread.id)
+                except Exception as e:
+                    logger.debug(f"Could not delete summary thread {thread.id}: {e}")
+        if self.usage is not None:
+            self.usage.add("summarize", stats['usage'])
+        if response is not None:
+            with self._lock:
+                if covered > self.covered:
+                    self.summary = response
+                    self.covered = covered
+        return response, stats
+
+    def update(self, messages):
+        # Bring the summary up to date with messages and return
+        # (summary, stats); stats is None when the checkpoint was current
+        self.wait()
+        if len(messages) <= self.covered:
+            return self.summary, None
+        response, stats = self._run(list(messages[self.covered:]), len(messages))
+        if response is None:
+            return None, stats
+        return self.summary, stats
+
+    def maybe_refresh(self, messages, executor):
+        # Start a background update once refresh_every turns (a user message
+        # and a reply each) have gone by since the checkpoint
+        if not self.refresh_every or self.pending():
+            return False
+        if len(messages) - self.covered < self.refresh_every * 2:
+            return False
+        self._future = executor.submit(self._run, list(messages[self.covered:]), len(messages), rate_limits.BACKGROUND)
+        return True
+
+    def restore(self, summary, messages):
+        # Start from a summary already known to cover messages, such as one
+        # found in the response cache
+        self.wait()
+        with self._lock:
+            self.summary = summary
+            self.covered = len(messages)
+
+    def mark_covered(self, messages):
+        # Count messages added since the checkpoint as covered without
+        # summarising them, e.g. the summary itself once it's in the chat
+        self.wait()
+        with self._lock:
+            self.covered = max(self.covered, len(messages))
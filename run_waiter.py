@@ -0,0 +1,104 @@
+import logging
+import time
+
+from metrics import histogram, span
+
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled', 'expired', 'incomplete'}
+
+logger = logging.getLogger(__name__)
+
+
+class RunTimeout(Exception):
+    pass
+
+
+class RunWaiter:
+    # Waits for an Assistants run to finish. Polls quickly at first and backs
+    # off towards max_interval, and gives up (and cancels the run) after
+    # deadline seconds or when the wait is interrupted by an exception.
+    def __init__(self, client, initial_interval=0.1, max_interval=2.0, backoff=1.5, deadline=120):
+        self.client = client
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.deadline = deadline
+
+    def wait(self, thread_id, run_id, deadline=None):
+        deadline = self.deadline if deadline is None else deadline
+        started = time.perf_counter()
+        interval = self.initial_interval
+        polls = 0
+
+        try:
+            while True:
+                run = self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+                polls += 1
+                if run.status in TERMINAL_STATUSES:
+                    break
+                if run.status == 'requires_action':
+                    # None of our assistants define tools, so nothing can
+                    # satisfy the action; cancel rather than wait forever.
+                    logger.warning(f"Run {run_id} requires action, cancelling")
+                    self.cancel(thread_id, run_id)
+                    break
+
+                remaining = deadline - (time.perf_counter() - started)
+                if remaining <= 0:
+                    raise RunTimeout(f"Run {run_id} did not finish within {deadline}s")
+                time.sleep(min(interval, remaining))
+                interval = min(interval * self.backoff, self.max_interval)
+        except BaseException:
+            # Deadline, KeyboardInterrupt or any other error mid-wait: don't
+            # leave the run holding the thread.
+            self.cancel(thread_id, run_id)
+            histogram("run_wait_seconds_interrupted").observe(time.perf_counter() - started)
+            raise
+
+        elapsed = time.perf_counter() - started
+        histogram(f"run_wait_seconds_{run.status}").observe(elapsed)
+        histogram("run_polls", buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55)).observe(polls)
+        return run, polls, elapsed
+
+    def cancel(self, thread_id, run_id):
+        try:
+            self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            # Runs that already reached a terminal state can't be cancelled
+            logger.debug(f"Could not cancel run {run_id}: {e}")
+
+
+def run_assistant(client, thread_id, assistant_id, waiter=None, deadline=None, **run_params):
+    # The create -> retrieve -> messages.list cycle shared by every app.
+    # Returns (response, stats); response is None unless the run completed.
+    waiter = waiter or RunWaiter(client)
+    started = time.perf_counter()
+    with span("run_create"):
+        run = client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            **run_params
+        )
+
+    stats = {"run_id": run.id, "status": None, "last_error": None, "polls": 0, "usage": None}
+    try:
+        with span("run_poll"):
+            run, stats["polls"], _ = waiter.wait(thread_id, run.id, deadline=deadline)
+    except RunTimeout as e:
+        # Our deadline, as opposed to the API's own 'expired' status
+        stats.update(status='timed_out', last_error=str(e), total=time.perf_counter() - started)
+        return None, stats
+
+    stats.update(status=run.status, last_error=run.last_error, usage=run.usage)
+    if run.status != 'completed':
+        stats["total"] = time.perf_counter() - started
+        return None, stats
+
+    with span("message_list"):
+        messages = client.beta.threads.messages.list(
+            thread_id=thread_id,
+            run_id=run.id,
+            limit=1
+        )
+    stats["total"] = time.perf_counter() - started
+    histogram("run_total_seconds").observe(stats["total"])
+    return messages.data[0].content[0].text.value, stats
@@ -0,0 +1,168 @@
+# Re-score saved transcripts offline, without Streamlit or OpenAI.
+#
+#   python score_transcripts.py saved_chats/ -o scores.jsonl --workers 8
+#
+# Inputs are .json files (a save_chat record {"timestamp", "chat_history"} or a
+# bare list of messages) and .jsonl files with one such record per line.
+# Results are appended to the output as JSONL as soon as each transcript is
+# scored; re-running with the same output skips transcripts already scored.
+# A transcript that can't be scored is written as {"id", "error"} and tried
+# again on the next run.
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import resources
+from sentiment import SentimentStore
+
+
+def iter_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(('.json', '.jsonl')):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def iter_transcripts(paths):
+    # Yields (transcript_id, raw JSON text) lazily so large archives never sit
+    # in memory; parsing happens in the workers, where a malformed record
+    # fails on its own
+    for path in iter_files(paths):
+        if path.endswith('.jsonl'):
+            with open(path, 'r') as f:
+                for line_number, line in enumerate(f, 1):
+                    if line.strip():
+                        yield f"{path}:{line_number}", line
+        else:
+            with open(path, 'r') as f:
+                yield path, f.read()
+
+
+def score_transcript(item):
+    transcript_id, text = item
+    record = json.loads(text)
+    if isinstance(record, list):
+        record = {"chat_history": record}
+    messages = record.get("chat_history") or []
+
+    sentiment = SentimentStore().sync(messages)
+    user_log = " ".join(msg['content'] for msg in messages if msg['role'] == 'user')
+    change_talk_score, stage_percentages = resources.change_talk_matcher.get().analyze(user_log)
+    classified_score, classified_percentages = resources.change_talk_classifier.get().analyze(user_log)
+
+    return {
+        "id": transcript_id,
+        "timestamp": record.get("timestamp"),
+        "messages": len(messages),
+        "sentiment": sentiment.overall(),
+        "sentiment_by_role": sentiment.by_role(),
+        "change_talk_score": change_talk_score,
+        "stage_percentages": stage_percentages,
+        "classified_change_talk_score": classified_score,
+        "classified_stage_percentages": classified_percentages,
+    }
+
+
+def _warm_up():
+    # Load the shared resources once per worker, not once per transcript
+    resources.sentiment_analyzer.get()
+    resources.change_talk_matcher.get()
+    resources.change_talk_classifier.get()
+
+
+def already_scored(output):
+    # IDs scored successfully so far. A last line cut short by an
+    # interruption is truncated away so appended results start on a fresh
+    # line; its transcript gets re-scored.
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, 'rb+') as f:
+        complete = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            complete += len(line)
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in result and "id" in result:
+                done.add(result["id"])
+        f.truncate(complete)
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score saved chat transcripts offline")
+    parser.add_argument("paths", nargs="+", help="transcript files or directories")
+    parser.add_argument("-o", "--output", default="scores.jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--in-flight", type=int, default=64, help="transcripts queued per worker at most")
+    parser.add_argument("--no-resume", action="store_true", help="rescore everything and overwrite the output")
+    args = parser.parse_args(argv)
+
+    done = set() if args.no_resume else already_scored(args.output)
+    if done:
+        print(f"Resuming: {len(done)} transcripts already scored", file=sys.stderr)
+
+    started = time.perf_counter()
+    last_report = started
+    scored = skipped = failed = messages = 0
+    max_in_flight = max(1, args.workers * args.in_flight)
+
+    with open(args.output, 'w' if args.no_resume else 'a') as out, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_warm_up) as pool:
+        pending = {}  # future -> transcript_id
+
+        def drain():
+            nonlocal scored, failed, messages
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                transcript_id = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"{transcript_id}: {type(e).__name__}: {e}", file=sys.stderr)
+                    out.write(json.dumps({"id": transcript_id, "error": f"{type(e).__name__}: {e}"}) + "\n")
+                    failed += 1
+                    continue
+                out.write(json.dumps(result) + "\n")
+                scored += 1
+                messages += result["messages"]
+            out.flush()
+
+        for item in iter_transcripts(args.paths):
+            if item[0] in done:
+                skipped += 1
+                continue
+            pending[pool.submit(score_transcript, item)] = item[0]
+            if len(pending) >= max_in_flight:
+                drain()
+
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                print(f"{scored} scored, {scored / (now - started):.1f} transcripts/s", file=sys.stderr)
+                last_report = now
+
+        while pending:
+            drain()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Scored {scored} transcripts ({messages} messages) in {elapsed:.1f}s: "
+        f"{scored / elapsed if elapsed else 0:.1f} transcripts/s, "
+        f"{messages / elapsed if elapsed else 0:.1f} messages/s; {skipped} skipped, {failed} failed",
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
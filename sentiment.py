@@ -0,0 +1,110 @@
+import json
+import math
+import os
+import sys
+
+# VADER's normalisation constant: compound = valence / sqrt(valence^2 + ALPHA)
+ALPHA = 15
+
+# Shown with the overall figure; see SentimentStore
+OVERALL_NOTE = "Approximate: combined from per-message VADER scores rather than scoring the whole chat at once"
+
+# Precompiled {word: valence} lexicon, built by build_vader_lexicon.py
+VADER_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vader_lexicon.json')
+
+
+def get_analyzer():
+    # SentimentIntensityAnalyzer parses its lexicon on construction, so it is
+    # built once per process and shared
+    from resources import sentiment_analyzer
+    return sentiment_analyzer.get()
+
+
+def load_offline_analyzer(path=VADER_LEXICON_PATH):
+    # Build a VADER analyzer from the packaged lexicon. Never touches the
+    # network or nltk_data, so cold starts work in air-gapped pods.
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
+
+    class OfflineSentimentIntensityAnalyzer(SentimentIntensityAnalyzer):
+        def __init__(self, lexicon):
+            self.lexicon_file = None
+            self.lexicon = lexicon
+            self.constants = VaderConstants()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return OfflineSentimentIntensityAnalyzer(json.load(f))
+
+
+def to_valence(compound):
+    # Invert VADER's normalisation so per-message scores can be summed
+    compound = max(min(compound, 0.9999), -0.9999)
+    return compound * math.sqrt(ALPHA / (1 - compound * compound))
+
+
+def to_compound(valence):
+    return valence / math.sqrt(valence * valence + ALPHA)
+
+
+class SentimentStore:
+    # Scores each chat message once and keeps running aggregates, so reading
+    # the conversation's sentiment doesn't re-score the whole history.
+    # Aggregates sum the messages' raw VADER valence and renormalise, which
+    # approximates scoring the joined transcript in one go: VADER's
+    # cross-sentence "but" rule and its document-level punctuation emphasis
+    # only see one message at a time, and each compound score is rounded to
+    # 4 decimals before it is inverted.
+    def __init__(self, analyzer=None):
+        self.analyzer = analyzer
+        self.reset()
+
+    def reset(self, source=None):
+        self.scores = []
+        self.roles = []
+        self.message_turns = []
+        self._source = source
+        self._valence = 0.0
+        self._role_valence = {}
+        self._turn_valence = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def add(self, role, content):
+        analyzer = self.analyzer or get_analyzer()
+        score = analyzer.polarity_scores(content)['compound']
+        valence = to_valence(score)
+
+        # A turn starts with each user message and includes the replies to it
+        if role == 'user' or not self._turn_valence:
+            self._turn_valence.append(0.0)
+        self._turn_valence[-1] += valence
+
+        self.scores.append(score)
+        self.roles.append(role)
+        self.message_turns.append(len(self._turn_valence) - 1)
+        self._valence += valence
+        self._role_valence[role] = self._role_valence.get(role, 0.0) + valence
+        return score
+
+    def sync(self, messages):
+        # Score only the messages appended since the last sync. A different
+        # or shorter list (reset, load_chat) starts the store over.
+        if messages is not self._source or len(messages) < len(self.scores):
+            self.reset(messages)
+        for message in messages[len(self.scores):]:
+            self.add(message['role'], message['content'])
+        return self
+
+    def memory_bytes(self):
+        # Scores and valences are floats; roles are shared strings
+        lists = (self.scores, self.roles, self.message_turns, self._turn_valence)
+        return sum(sys.getsizeof(values) for values in lists) + 24 * (len(self.scores) + len(self._turn_valence))
+
+    def overall(self):
+        return to_compound(self._valence) if self.scores else 0.0
+
+    def by_role(self):
+        return {role: to_compound(valence) for role, valence in self._role_valence.items()}
+
+    def by_turn(self):
+        return [to_compound(valence) for valence in self._turn_valence]
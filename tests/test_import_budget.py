@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import import_budget
+
+# The apps' own dependencies must be installed for their imports to be timed
+pytest.importorskip("streamlit")
+
+
+@pytest.mark.parametrize("app", import_budget.APPS)
+def test_app_imports_within_budget(app):
+    assert import_budget.main([app]) == 0